@@ -0,0 +1,137 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from models import Portfolio
+
+logger = logging.getLogger(__name__)
+
+# per-contract output -> position-weighted aggregate
+MEASURES = {
+    "Price": "Market Value",
+    "Delta": "Net Delta",
+    "Gamma": "Net Gamma",
+    "Vega": "Net Vega",
+    "Theta": "Net Theta",
+    "Rho": "Net Rho",
+}
+
+
+class Rollup:
+    """
+    Position-weighted exposures of a priced book (quantity x multiplier x greek) by
+    bucket (ticker, expiry...) and for the whole book. The per-contract contributions
+    are kept, repricing some contracts or changing some positions only moves the
+    buckets of those contracts by the difference
+    Attributes
+    ==========
+    portfolio: priced Portfolio (or dataframe with its columns)
+    by: columns defining the buckets, one rollup by column
+
+    """
+
+    def __init__(self, portfolio, by=("Ticker", "Maturity")):
+        # a priced dataframe is read as it is, Portfolio() would reset its outputs
+        data = portfolio.data if isinstance(portfolio, Portfolio) else portfolio
+        self.by = list(by)
+        self.quantity, self.multiplier = (
+            (
+                data[col].to_numpy(dtype=float)
+                if col in data
+                else np.full(len(data), Portfolio.DEFAULTS[col])
+            ).copy()
+            for col in ["Quantity", "Multiplier"]
+        )
+        self.greeks = np.column_stack(
+            [data[col].to_numpy(dtype=float) for col in MEASURES]
+        ).reshape(len(data), len(MEASURES))
+
+        # bucket of each contract, by dimension
+        self.codes = {}
+        self.labels = {}
+        for col in self.by:
+            codes, labels = pd.factorize(data[col], sort=True)
+            self.codes[col] = codes
+            self.labels[col] = labels
+
+        # unpriced contracts (NaN) do not contribute
+        self.contrib = np.nan_to_num(self._weight()[:, None] * self.greeks)
+        self.sums = {
+            col: np.column_stack(
+                [
+                    np.bincount(
+                        self.codes[col],
+                        weights=self.contrib[:, j],
+                        minlength=len(self.labels[col]),
+                    )
+                    for j in range(len(MEASURES))
+                ]
+            ).reshape(len(self.labels[col]), len(MEASURES))
+            for col in self.by
+        }
+        self.total = self.contrib.sum(axis=0)
+
+    def _weight(self, rows=slice(None)) -> np.ndarray:
+        return self.quantity[rows] * self.multiplier[rows]
+
+    def _move(self, rows: np.ndarray):
+        """
+        Recompute the contributions of rows and move their buckets by the difference
+        """
+        new = np.nan_to_num(self._weight(rows)[:, None] * self.greeks[rows])
+        diff = new - self.contrib[rows]
+        self.contrib[rows] = new
+        for col in self.by:
+            np.add.at(self.sums[col], self.codes[col][rows], diff)
+        self.total += diff.sum(axis=0)
+
+    def reprice(self, rows, greeks: dict) -> np.ndarray:
+        """
+        :param rows: positions of the repriced contracts
+        :param greeks: new outputs of those rows (Price, Delta, ... as in Portfolio),
+            or whole-book arrays such as PricedBook.values
+        :return: the rows updated
+        """
+        rows = np.asarray(rows, dtype=int)
+        for j, col in enumerate(MEASURES):
+            values = np.asarray(greeks[col], dtype=float)
+            # assigned in the caller's order, last value wins for a duplicate row
+            self.greeks[rows, j] = (
+                values[rows] if len(values) == len(self.quantity) else values
+            )
+        rows = np.unique(rows)
+        self._move(rows)
+        return rows
+
+    def set_quantity(self, rows, quantity) -> np.ndarray:
+        """
+        Change positions, 0 closes them
+        :param rows: positions of the contracts
+        :param quantity: new quantities (scalar or one per row)
+        :return: the rows updated
+        """
+        rows = np.asarray(rows, dtype=int)
+        # last value wins when a contract is given twice
+        self.quantity[rows] = np.broadcast_to(np.asarray(quantity, float), rows.shape)
+        rows = np.unique(rows)
+        self._move(rows)
+        return rows
+
+    def frame(self, by: str = None) -> pd.DataFrame:
+        """
+        :param by: one of the bucket columns, the first one by default
+        :return: dataframe of the exposures by bucket
+        """
+        by = self.by[0] if by is None else by
+        return pd.DataFrame(
+            self.sums[by],
+            index=pd.Index(self.labels[by], name=by),
+            columns=list(MEASURES.values()),
+        )
+
+    def totals(self) -> pd.Series:
+        """
+        :return: exposures of the whole book
+        """
+        return pd.Series(self.total, index=list(MEASURES.values()), name="Total")
@@ -0,0 +1,287 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from export import export
+from models import Options, Portfolio
+from providers import OfflineProvider
+
+
+def synthetic_book(n: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Deterministic book of options shaped like the get_option output
+    :param n: number of contracts
+    :param seed: seed of the random generator
+    :return: dataframe with the get_option columns
+    """
+    rng = np.random.default_rng(seed)
+    tickers = np.array([f"SYN{i:03d}" for i in range(100)])
+    expiries = np.array(
+        [(date.today() + timedelta(days=30 * (i + 1))).isoformat() for i in range(12)]
+    )
+    ticker = rng.integers(0, len(tickers), n)
+    spot = rng.uniform(20, 500, len(tickers))[ticker]
+    strike = np.round(spot * rng.uniform(0.6, 1.4, n), 1)
+    return pd.DataFrame(
+        {
+            "Ticker": tickers[ticker],
+            "Spot": spot,
+            "Maturity": expiries[rng.integers(0, len(expiries), n)],
+            "Type": np.where(rng.random(n) < 0.5, "call", "put"),
+            "Contract Symbol": [f"C{i}" for i in range(n)],
+            "Strike": strike,
+            "Volatility": rng.uniform(0.1, 0.6, n),
+            "Market Price": np.nan,
+            "Volume": rng.integers(0, 5000, n).astype(float),
+            "Currency": "USD",
+        }
+    )
+
+
+def measure(func, repeat: int = 3) -> float:
+    """
+    :param func: callable to time
+    :param repeat: number of runs
+    :return: best wall time in seconds
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+@lru_cache(maxsize=None)
+def _book(n: int) -> pd.DataFrame:
+    return synthetic_book(n)
+
+
+@lru_cache(maxsize=None)
+def _folder() -> str:
+    return tempfile.mkdtemp()
+
+
+@lru_cache(maxsize=None)
+def _priced(n: int) -> pd.DataFrame:
+    return Portfolio(_book(n)).price().data
+
+
+def cases(quick: bool = False) -> dict:
+    """
+    Benchmarks registered by factory, the books and inputs of a case are only built
+    when it runs (and shared with the following cases)
+    :param quick: skip the 1M contracts cases
+    :return: dict name -> (factory returning the callable to time, number of items
+        processed or None when a rate means nothing, repeat)
+    """
+    sizes = [1_000, 100_000] + ([] if quick else [1_000_000])
+    benchmarks = {}
+
+    # scalar vs batch pricing kernels
+    def scalar_args() -> list:
+        small = _book(1_000)
+        return [
+            (k, s, t, v, ty.upper())
+            for k, s, t, v, ty in zip(
+                small["Strike"],
+                small["Spot"],
+                Portfolio(small).data["T"],
+                small["Volatility"],
+                small["Type"],
+            )
+        ]
+
+    def scalar_methods():
+        args = scalar_args()
+        return lambda: [
+            (o.bsm(ty), o.delta(ty), o.gamma(), o.vega(), o.theta(ty))
+            for o, ty in ((Options(k, s, t, v), ty) for k, s, t, v, ty in args)
+        ]
+
+    def scalar_all_greeks():
+        args = scalar_args()
+        return lambda: [
+            Options(k, s, t, v).all_greeks(ty, False) for k, s, t, v, ty in args
+        ]
+
+    benchmarks["scalar_methods_1k"] = (scalar_methods, 1_000, 3)
+    benchmarks["scalar_all_greeks_1k"] = (scalar_all_greeks, 1_000, 3)
+
+    # full portfolio runs
+    for n in sizes:
+        benchmarks[f"portfolio_price_{n}"] = (
+            lambda n=n: Portfolio(_book(n)).price,
+            n,
+            3,
+        )
+        benchmarks[f"portfolio_build_and_price_{n}"] = (
+            lambda n=n: (lambda book=_book(n): Portfolio(book).price()),
+            n,
+            1 if n >= 1_000_000 else 3,
+        )
+
+    # fetch pipeline on the synthetic provider (no network)
+    def fetch(full=False):
+        provider = Options.provider
+        Options.provider = OfflineProvider(n_tickers=100, seed=0)
+        try:
+            Options.get_option(Options.retrieve_ticker(), full=full).price()
+        finally:
+            Options.provider = provider
+
+    benchmarks["fetch_offline_100_tickers"] = (lambda: fetch, 100, 3)
+    # 100 tickers x 8 expiries x 40 strikes x call/put
+    benchmarks["fetch_offline_full_chain_64000"] = (
+        lambda: lambda: fetch(True),
+        64_000,
+        1,
+    )
+
+    # implied volatility, cold and warm started
+    def implied_vol(warm: bool):
+        data = _priced(100_000)
+        prices = Options.greeks_batch(
+            data["Strike"],
+            data["Spot"],
+            data["T"],
+            data["Volatility"],
+            data["Type"],
+            rounding=False,
+        )["price"]
+        sigma0 = data["Volatility"].to_numpy() * 1.01 if warm else None
+        return lambda: Options.implied_vol(
+            prices, data["Strike"], data["Spot"], data["T"], data["Type"], sigma0=sigma0
+        )
+
+    benchmarks["implied_vol_cold_100000"] = (lambda: implied_vol(False), 100_000, 3)
+    benchmarks["implied_vol_warm_100000"] = (lambda: implied_vol(True), 100_000, 3)
+
+    # exports
+    def exporter(ext: str, n: int):
+        data = _priced(100_000).iloc[:n]
+        return lambda: export(data, os.path.join(_folder(), f"b.{ext}"))
+
+    benchmarks["export_excel_10000"] = (lambda: exporter("xlsx", 10_000), 10_000, 1)
+    benchmarks["export_csv_100000"] = (lambda: exporter("csv", 100_000), 100_000, 1)
+    try:
+        import pyarrow  # noqa: F401
+
+        for ext in ["parquet", "feather"]:
+            benchmarks[f"export_{ext}_100000"] = (
+                lambda ext=ext: exporter(ext, 100_000),
+                100_000,
+                3,
+            )
+    except ImportError:
+        pass
+
+    # pdf chart
+    def chart():
+        import matplotlib
+
+        matplotlib.use("Agg")
+        from views import Major
+
+        cwd = os.getcwd()
+        os.chdir(_folder())
+        try:
+            Major.option_chart(Options)
+        finally:
+            os.chdir(cwd)
+
+    benchmarks["option_chart_pdf"] = (lambda: chart, None, 1)
+    return benchmarks
+
+
+def run(quick: bool = False, only: str = None) -> dict:
+    """
+    :param quick: skip the 1M contracts cases
+    :param only: run only the benchmarks whose name contains this string
+    :return: dict with the environment and the result of each benchmark
+    """
+    results = {}
+    for name, (factory, items, repeat) in cases(quick).items():
+        if only and only not in name:
+            continue
+        seconds = measure(factory(), repeat)
+        rate = items / seconds if items and seconds else None
+        results[name] = {"seconds": seconds, "items": items, "items_per_sec": rate}
+        line = f"{name:<40} {seconds * 1000:>12.2f} ms"
+        print(line if rate is None else f"{line} {rate:>16,.0f} /s")
+
+    return {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """
+    :param current: output of run()
+    :param baseline: output of a previous run()
+    :param threshold: relative slowdown tolerated (0.2 = 20% slower)
+    :return: list of the regressions (name, baseline seconds, current seconds)
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before and result["seconds"] > before["seconds"] * (1 + threshold):
+            regressions.append((name, before["seconds"], result["seconds"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the BSM pricer")
+    parser.add_argument("-o", "--output", default="benchmark.json")
+    parser.add_argument("--quick", action="store_true", help="skip the 1M cases")
+    parser.add_argument("--only", help="run the benchmarks containing this string")
+    parser.add_argument("--compare", help="baseline JSON of a previous run")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument(
+        "--scaling",
+        type=int,
+        metavar="N",
+        help="also report the parallel pricer scaling by core count on N contracts",
+    )
+    args = parser.parse_args(argv)
+
+    current = run(args.quick, args.only)
+    if args.scaling:
+        from parallel import scaling_report
+
+        report = scaling_report(synthetic_book(args.scaling, seed=0))
+        print(report.to_string())
+        current["scaling"] = report.reset_index().to_dict("records")
+    with open(args.output, "w") as f:
+        json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before * 1000:.2f} ms -> {after * 1000:.2f} ms")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from models import (
+    STATUS,
+    Options,
+    Portfolio,
+    _invariants,
+    _option_flags,
+    _spot_greeks,
+    _status,
+    discounting,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PricedBook:
+    """
+    Priced portfolio kept live on spot moves. The spot independent terms of every
+    contract (log strike, sigma*sqrt(t), drift, discount factors) are computed once,
+    a spot tick only reprices the contracts of the tickers that moved, in place
+    Attributes
+    ==========
+    portfolio: Portfolio (or dataframe with its columns) to monitor
+    r: risk-free rate(s) or Curve
+    q: dividend yield(s) or Curve
+    rounding: round the outputs like Portfolio.price
+
+    """
+
+    def __init__(self, portfolio, r=0.05, q=0.04, rounding: bool = True):
+        if not isinstance(portfolio, Portfolio):
+            portfolio = Portfolio(portfolio)
+        self.portfolio = portfolio
+        self.rounding = rounding
+        data = portfolio.data
+        n = len(data)
+
+        self.spot = data["Spot"].to_numpy(dtype=float).copy()
+        self.strike = data["Strike"].to_numpy(dtype=float)
+        self.is_call, self.is_put = _option_flags(data["Type"])
+        r, disc_r = discounting(r, portfolio.expiries)
+        q, disc_q = discounting(q, portfolio.expiries)
+        self.invariants = _invariants(
+            self.strike,
+            data["T"].to_numpy(dtype=float),
+            data["Volatility"].to_numpy(dtype=float),
+            r,
+            q,
+            disc_r,
+            disc_q,
+        )
+
+        # row positions of each ticker, found once
+        ticker = data["Ticker"].astype("category")
+        codes = ticker.cat.codes.to_numpy()
+        order = np.argsort(codes, kind="stable")
+        starts = np.flatnonzero(np.r_[True, codes[order][1:] != codes[order][:-1]])
+        self.rows = {}
+        if n:
+            self.rows = {
+                ticker.cat.categories[codes[order[s]]]: rows
+                for s, rows in zip(starts, np.split(order, starts[1:]))
+            }
+
+        # outputs owned by the book, refreshed in place by update_spots
+        greeks = self._reprice(slice(None))
+        self.values = {col: greeks[col.lower()] for col in Portfolio.OUTPUTS}
+        self.status = _status(
+            self.strike, self.spot, self.is_call, self.is_put
+        ).codes.copy()
+
+    def _reprice(self, rows) -> dict:
+        inv = {k: v[rows] for k, v in self.invariants.items()}
+        return _spot_greeks(
+            self.spot[rows], inv, self.is_call[rows], self.is_put[rows], self.rounding
+        )
+
+    def __len__(self) -> int:
+        return len(self.spot)
+
+    def update_spots(self, spots: dict) -> int:
+        """
+        Reprice the contracts of the tickers whose spot changed
+        :param spots: dict ticker -> new spot, unknown tickers are ignored
+        :return: number of contracts repriced
+        """
+        moved = [t for t in spots if t in self.rows]
+        if len(moved) < len(spots):
+            logger.debug(f"not in the book: {set(spots) - set(moved)}")
+        if not moved:
+            return 0
+
+        rows = np.concatenate([self.rows[t] for t in moved])
+        self.spot[rows] = np.repeat(
+            [float(spots[t]) for t in moved], [len(self.rows[t]) for t in moved]
+        )
+        greeks = self._reprice(rows)
+        for col in Portfolio.OUTPUTS:
+            self.values[col][rows] = greeks[col.lower()]
+        self.status[rows] = _status(
+            self.strike[rows], self.spot[rows], self.is_call[rows], self.is_put[rows]
+        ).codes
+        return len(rows)
+
+    def refresh(self, provider=None) -> int:
+        """
+        Download the last spots of the book's tickers and reprice the moves
+        :param provider: market data provider, Options.provider by default
+        :return: number of contracts repriced
+        """
+        provider = Options.provider if provider is None else provider
+        spots = provider.spots(list(self.rows))
+        changed = {
+            t: s for t, s in spots.items() if np.any(self.spot[self.rows[t]] != s)
+        }
+        return self.update_spots(changed)
+
+    @property
+    def data(self) -> pd.DataFrame:
+        """
+        :return: the portfolio dataframe with the current spots, prices, greeks and status
+        """
+        data = self.portfolio.data
+        data["Spot"] = self.spot
+        for col, values in self.values.items():
+            data[col] = values
+        data["Status"] = pd.Categorical.from_codes(self.status, dtype=STATUS)
+        return data
@@ -0,0 +1,158 @@
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# time to live of each kind of data (in seconds)
+TTL = {
+    "constituents": 3 * 24 * 3600,
+    "spots": 30,
+    "expiries": 3600,
+    "chains": 15 * 60,
+}
+
+
+class DataCache:
+    """
+    Local TTL cache of the market data, stored in a SQLite file
+    Attributes
+    ==========
+    path: location of the SQLite file
+    ttl: time to live by kind of data (in seconds), overrides the TTL defaults
+    max_bytes: size bound of the cache, the oldest entries are evicted beyond it
+    offline: serve entries whatever their age (cached snapshots used as fixtures)
+
+    """
+
+    def __init__(
+        self,
+        path: str = os.path.join(".cache", "bsm_cache.sqlite"),
+        ttl: dict = None,
+        max_bytes: int = 256 * 1024**2,
+        offline: bool = False,
+    ):
+        self.path = path
+        self.ttl = {**TTL, **(ttl or {})}
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+
+        # private
+        self._lock = threading.Lock()
+        self._ready = False
+
+    @contextmanager
+    def _connect(self):
+        """
+        Open the SQLite file (the table is created on first use), commit and close on exit
+        :return: sqlite connection
+        """
+        if not self._ready:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+        con = sqlite3.connect(self.path)
+        if not self._ready:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "kind TEXT, key TEXT, created REAL, size INTEGER, payload BLOB, "
+                "PRIMARY KEY (kind, key))"
+            )
+            self._ready = True
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def get(self, kind: str, key: str):
+        """
+        :param kind: kind of data (constituents, spots, expiries, chains)
+        :param key: key of the entry inside its kind (ticker, ticker/expiry, ...)
+        :return: cached value, None if missing or expired
+        """
+        with self._lock, self._connect() as con:
+            row = con.execute(
+                "SELECT created, payload FROM entries WHERE kind = ? AND key = ?",
+                (kind, key),
+            ).fetchone()
+
+        if row is None or not (self.offline or self.is_fresh(kind, row[0])):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(row[1])
+
+    def get_many(self, kind: str, keys: list) -> dict:
+        """
+        :param kind: kind of data
+        :param keys: keys to look up
+        :return: dict of the fresh entries found, keyed like the input
+        """
+        found = {}
+        for key in keys:
+            value = self.get(kind, key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def has(self, kind: str, key: str) -> bool:
+        with self._lock, self._connect() as con:
+            row = con.execute(
+                "SELECT created FROM entries WHERE kind = ? AND key = ?", (kind, key)
+            ).fetchone()
+        return row is not None and (self.offline or self.is_fresh(kind, row[0]))
+
+    def is_fresh(self, kind: str, created: float) -> bool:
+        return time.time() - created <= self.ttl.get(kind, 0)
+
+    def set(self, kind: str, key: str, value):
+        """
+        Store a value (snapshot time is the insertion time) and evict beyond the size bound
+        :param kind: kind of data
+        :param key: key of the entry inside its kind
+        :param value: any picklable object (list, dataframe, ...)
+        """
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock, self._connect() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (kind, key, time.time(), len(payload), payload),
+            )
+            self._evict(con)
+
+    def set_many(self, kind: str, values: dict):
+        for key, value in values.items():
+            self.set(kind, key, value)
+
+    def _evict(self, con: sqlite3.Connection):
+        """
+        Delete the oldest entries until the cache fits in max_bytes
+        """
+        total = con.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for kind, key, size in con.execute(
+            "SELECT kind, key, size FROM entries ORDER BY created"
+        ).fetchall():
+            con.execute("DELETE FROM entries WHERE kind = ? AND key = ?", (kind, key))
+            total -= size
+            logger.debug(f"cache entry {kind}/{key} evicted")
+            if total <= self.max_bytes:
+                break
+
+    def clear(self, kind: str = None):
+        """
+        :param kind: kind of data to drop, everything if None
+        """
+        with self._lock, self._connect() as con:
+            if kind is None:
+                con.execute("DELETE FROM entries")
+            else:
+                con.execute("DELETE FROM entries WHERE kind = ?", (kind,))
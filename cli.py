@@ -0,0 +1,119 @@
+import argparse
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from export import sink_for
+from models import Options
+
+logger = logging.getLogger(__name__)
+
+
+def read_chunks(path: str, chunksize: int):
+    """
+    Read a position file chunk by chunk
+    :param path: CSV or Parquet file
+    :param chunksize: number of rows by chunk
+    :return: generator of dataframes
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize)
+
+
+def price_chunk(data: pd.DataFrame, r: float, q: float) -> pd.DataFrame:
+    """
+    Price one chunk of positions
+    :param data: dataframe with Strike, Spot, Volatility, Type and Maturity (YYYY-MM-DD)
+        or T (year fraction) columns
+    :return: the chunk with the price, greeks and status columns added
+    """
+    return Options.price_frame(data, r=r, q=q)
+
+
+def run(
+    source: str,
+    output: str,
+    chunksize: int = 100_000,
+    workers: int = 1,
+    r: float = 0.05,
+    q: float = 0.04,
+) -> dict:
+    """
+    Price a position file out of core: read, price and write chunk by chunk
+    :param source: CSV or Parquet position file
+    :param output: result file (csv, parquet, feather/arrow or xlsx)
+    :param chunksize: number of rows by chunk
+    :param workers: number of pricing processes (1 prices in the current process)
+    :return: dict with the number of contracts, the duration and the throughput
+    """
+    start = time.perf_counter()
+    chunks = read_chunks(source, chunksize)
+
+    # a failed run removes the partial file (Sink.abort)
+    with sink_for(output) as writer:
+        if workers > 1:
+            # at most 2 chunks in flight by worker, results written in input order
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(executor.submit(price_chunk, chunk, r, q))
+                    if len(pending) >= 2 * workers:
+                        writer.append(pending.popleft().result())
+                while pending:
+                    writer.append(pending.popleft().result())
+        else:
+            for chunk in chunks:
+                writer.append(price_chunk(chunk, r, q))
+
+    duration = time.perf_counter() - start
+    return {
+        "contracts": writer.rows,
+        "seconds": duration,
+        "contracts_per_sec": writer.rows / duration if duration else float("nan"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Price a portfolio file with the BSM model, without the GUI"
+    )
+    parser.add_argument("source", help="CSV or Parquet position file")
+    parser.add_argument(
+        "output", help="result file: csv, parquet, feather/arrow or xlsx"
+    )
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--rf", type=float, default=0.05, help="risk-free rate")
+    parser.add_argument("--div", type=float, default=0.04, help="dividend yield")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.source):
+        parser.error(f"{args.source} not found")
+
+    stats = run(
+        args.source, args.output, args.chunksize, args.workers, args.rf, args.div
+    )
+    logger.info(stats)
+    print(
+        f"{stats['contracts']} contracts priced in {stats['seconds']:.2f}s "
+        f"({stats['contracts_per_sec']:,.0f} contracts/sec)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(" "name)s - %(" "levelname)s - %(" "message)s",
+    )
+    sys.exit(main())
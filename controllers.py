@@ -1,93 +1,131 @@
 import logging
+import queue
+import threading
 import tkinter as tk
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 
+import pandas as pd
+
+from aggregation import Rollup
+from curves import default_curves
+from instrumentation import metrics, profile_run, span
+
 logger = logging.getLogger(__name__)
 
 
 class MinorController:
-    def __init__(self, model, view):
+    # delay between the last keystroke and the live recompute
+    DEBOUNCE_MS = 250
+
+    def __init__(self, model, view, curves: tuple = None):
         self.model = model
         self.view = view
+        # risk-free and dividend curves used when the optional inputs are empty
+        self.rf_curve, self.div_curve = curves or default_curves()
+
+        # private
+        self._pending = None  # after() id of the scheduled live recompute
+        self._last = None  # inputs of the quote on display
         self._bind()
 
     def _bind(self):
         self.view.btn_compute.config(command=self.computation)
         self.view.chk_ticker.config(command=self.fetch_spot)
+        self.view.chk_live.config(command=self.schedule)
+        for entry in self.view.inputs():
+            entry.bind("<KeyRelease>", self.schedule, add="+")
 
-    def computation(self):
+    def _read_inputs(self) -> tuple:
         """
-        Compute the option price.
-        Use Options class - function bsm
-        Return: float
-        -------
+        Parse the entries of the frame
+        :return: (type, strike, spot, maturity, volatility, rf, div)
+        :raise ValueError: with the message to display
         """
-
+        op_type = str(self.view.ent_type.get().strip().upper())
+        if op_type == "":
+            raise ValueError("Please enter Option type")
+        if op_type not in ("CALL", "PUT"):
+            raise ValueError("The option type should be Call or Put")
+        try:
+            maturity = (
+                datetime.strptime(self.view.ent_maturity.get(), "%d/%m/%Y")
+                - datetime.now()
+            ).days / 365
+        except ValueError:
+            raise ValueError("The maturity should be in DD/MM/YYYY")
         try:
-            op_type = str(self.view.ent_type.get().upper())
-            if op_type == "":
-                self.view.error_msg("Please enter Option type")
             strike_price = float(self.view.ent_strike.get())
             spot_price = float(self.view.ent_spot.get())
-            try:
-                maturity = (
-                    datetime.strptime(self.view.ent_maturity.get(), "%d/%m/%Y")
-                    - datetime.now()
-                ).days / 365
-            except Exception as e:
-                logger.error(e.args)
-                print(e.args)
-                self.view.error_msg("The maturity should be in DD/MM/YYYY")
             volatility = float(self.view.ent_vol.get())
-        except Exception as e:
-            logger.error(e.args)
-            print(e.args)
-            self.view.error_msg("Attribute missing, please check your input")
+        except ValueError:
+            raise ValueError("Attribute missing, please check your input")
 
+        # empty optional inputs are read on the configured curves at the maturity
+        rf_text = self.view.ent_rf.get().strip()
+        div_text = self.view.ent_div.get().strip()
         try:
-            rf = float(self.view.ent_rf.get()) / 100
-            div = float(self.view.ent_div.get()) / 100
+            rf = (
+                float(rf_text) / 100 if rf_text else float(self.rf_curve.rate(maturity))
+            )
+            div = (
+                float(div_text) / 100
+                if div_text
+                else float(self.div_curve.rate(maturity))
+            )
         except ValueError:
-            rf = 0.05
-            div = 0.04
+            raise ValueError("The risk free rate and dividend yield should be in %")
+        if not rf_text or not div_text:
+            logger.info(f"curve rates used: rf {rf:.4%}, div {div:.4%}")
+        return op_type, strike_price, spot_price, maturity, volatility, rf, div
 
-        op = self.model(strike_price, spot_price, maturity, volatility, rf, div)
-        price = op.bsm(op_type)
-        delta = op.delta(op_type)
-        gamma = op.gamma()
-        vega = op.vega()
-        theta = op.theta(op_type)
-        status = op.intrinsic_value(op_type)[0]
-        value = str(op.intrinsic_value(op_type)[1])
-
-        self.view.ent_price.delete(0, tk.END)
-        self.view.ent_price.insert(0, str(price))
-
-        self.view.ent_delta.delete(0, tk.END)
-        self.view.ent_delta.insert(0, str(delta))
-
-        self.view.ent_gamma.delete(0, tk.END)
-        self.view.ent_gamma.insert(0, str(gamma))
-
-        self.view.ent_vega.delete(0, tk.END)
-        self.view.ent_vega.insert(0, str(vega))
-
-        self.view.ent_theta.delete(0, tk.END)
-        self.view.ent_theta.insert(0, str(theta))
+    def schedule(self, event=None):
+        """
+        Live mode: recompute once the user stopped typing for DEBOUNCE_MS
+        """
+        if self._pending is not None:
+            self.view.after_cancel(self._pending)
+            self._pending = None
+        if self.view.var_live.get():
+            self._pending = self.view.after(self.DEBOUNCE_MS, self.computation, True)
 
-        # delete label if already printed
+    def computation(self, live: bool = False):
+        """
+        Compute the option price.
+        Use Options class - function quote (memoized)
+        Parameters
+        ----------
+        live : called by the live mode, invalid or unchanged inputs are skipped silently
+        """
+        self._pending = None
         try:
-            self.view.lbl_status.grid_forget()
-            self.view.lbl_val.grid_forget()
-        except Exception as e:
-            logger.error(e.args)
-            print(e.args)
-            pass
+            inputs = self._read_inputs()
+        except ValueError as e:
+            if not live:
+                logger.error(e.args)
+                self.view.error_msg(str(e))
+            return
+        if live and inputs == self._last:
+            return
+        self._last = inputs
+
+        quote = self.model.quote(*inputs)
+        for entry, name in [
+            (self.view.ent_price, "price"),
+            (self.view.ent_delta, "delta"),
+            (self.view.ent_gamma, "gamma"),
+            (self.view.ent_vega, "vega"),
+            (self.view.ent_theta, "theta"),
+        ]:
+            entry.delete(0, tk.END)
+            entry.insert(0, str(quote[name]))
 
         logger.info(
-            f"greeks and price generated \n price:{price}, status: {status}, delta:{delta}"
+            f"greeks and price generated \n price:{quote['price']}, "
+            f"status: {quote['status']}, delta:{quote['delta']}"
         )
-        self.view.update_status(status, value)
+        logger.debug(f"quote cache: {self.model.quote_cache_info()}")
+        self.view.update_status(quote["status"], str(quote["value"]))
 
     def fetch_spot(self):
         """
@@ -110,80 +148,236 @@ class MinorController:
         else:
             self.view.chk_ticker_ent.delete(0, tk.END)
             self.view.ent_spot.delete(0, tk.END)
+        self.schedule()
+
+
+class Cancelled(Exception):
+    """Raised inside a background job when the user pressed Cancel"""
+
+
+def _build_chart(model):
+    """
+    Generate the options' chart PDF in a worker process (no display needed)
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from views import Major
+
+    Major.option_chart(model)
 
 
 class MajorController:
-    def __init__(self, model, view):
+    def __init__(self, model, view, curves: tuple = None):
         self.model = model
         self.view = view
+        self.rf_curve, self.div_curve = curves or default_curves()
+        self._threads = ThreadPoolExecutor(max_workers=2)  # I/O (download, export)
+        self._processes = ProcessPoolExecutor(max_workers=2)  # pricing and plotting
+        self._progress = queue.Queue()
+        self._chunks = queue.Queue()
+        self._table_open = False
+        self._cancel = threading.Event()
         self._bind()
 
     def _bind(self):
         self.view.btn_run.config(command=self.run_bsm_ptf)
         self.view.btn_chart.config(command=self.chart)
+        self.view.btn_cancel.config(command=self.cancel)
+
+    def _submit(self, executor, job, on_done, *args, cancellable: bool = True):
+        """
+        Run a job in a worker pool and hand its result back to the Tk thread
+        Parameters
+        ----------
+        executor : thread or process pool running the job
+        job : callable executed in the worker
+        on_done : callback receiving the result, called on the Tk thread
+        cancellable : the job checks the cancel event, else Cancel stays disabled
+        """
+        self._cancel.clear()
+        self.view.set_running(True, cancellable)
+        future = executor.submit(job, *args)
+        self.view.after(100, self._poll, future, on_done)
+
+    def _poll(self, future, on_done):
+        """
+        Tk side of a background job: refresh the progress and wait for the result
+        """
+        while not self._progress.empty():
+            self.view.update_progress(*self._progress.get_nowait())
+        while not self._chunks.empty():
+            self._show_chunk(self._chunks.get_nowait())
+
+        if not future.done():
+            self.view.after(100, self._poll, future, on_done)
+            return
+
+        self.view.set_running(False)
+        try:
+            result = future.result()
+        except Cancelled as e:
+            self.view.update_progress(0, f"Cancelled: {e}" if e.args else "Cancelled")
+            return
+        except Exception as e:
+            logger.error(e.args)
+            self.view.update_progress(0, "Failed")
+            self.view.info_msg(f"Computation failed: {e}")
+            return
+        on_done(result)
+
+    def _report(self, value: float, text: str):
+        """
+        Queue a progress update from a worker, raise if the user cancelled the job
+        """
+        if self._cancel.is_set():
+            raise Cancelled()
+        self._progress.put((value, text))
+
+    def cancel(self):
+        self._cancel.set()
 
     def run_bsm_ptf(self):
         """
-        Lunch BSM model computation of option price, delta, gamma and vega
+        Lunch BSM model computation of option price, delta, gamma and vega in the background,
+        the contracts are displayed as soon as their chain is priced
         Returns: dataframe with all options infos
         -------
         """
-        stock_price = self.model.retrieve_ticker()  # retrieve the ticker and spot
-        df = self.model.get_option(
-            stock_price
-        )  # retrieve option data from yahoo finance
+        path = None
+        if self.view.var2.get():
+            # the dialog runs on the Tk thread, the export itself in the worker
+            path = self.view.ask_export_path()
+            if not path:
+                return
+        self._table_open = False
+        self._submit(
+            self._threads,
+            self._profiled_job,
+            self._portfolio_done,
+            path,
+            self.view.var_full.get(),
+        )
 
-        df["Price"] = 0
-        df["Delta"] = 0
-        df["Gamma"] = 0
-        df["Vega"] = 0
-        df["Theta"] = 0
-        df["Status"] = 0
-
-        # Computing Option price, delta, gamma and vega
-        for i in range(len(df)):
-            #  Instantiation of Options class
-            op = self.model(
-                strike=df["Strike"].loc[i],
-                spot=df["Spot"].loc[i],
-                sigma=df["Volatility"].loc[i],
-                t=(
-                    datetime.strptime(df["Maturity"].loc[i], "%Y-%m-%d")
-                    - datetime.now()
-                ).days
-                / 365,
-            )
+    def _profiled_job(self, path: str, full: bool) -> dict:
+        # cProfile/tracemalloc capture when BSM_PROFILE=1
+        with profile_run(), span("portfolio_run") as record:
+            result = self._portfolio_job(path, full)
+            record["items"] = result["rows"]
+        return result
 
-            df["Status"].loc[i] = op.intrinsic_value(
-                option_type=df["Type"].loc[i].upper()
-            )[0]
-            df["Price"].loc[i] = op.bsm(option_type=df["Type"].loc[i].upper())
-            df["Delta"].loc[i] = op.delta(option_type=df["Type"].loc[i].upper())
-            df["Theta"].loc[i] = op.theta(option_type=df["Type"].loc[i].upper())
-            df["Gamma"].loc[i] = op.gamma()
-            df["Vega"].loc[i] = op.vega()
+    def _portfolio_job(self, path: str, full: bool = False) -> dict:
+        """
+        Worker side of run_bsm_ptf: stream the chains, price each one on arrival and
+        hand it to the table view and the export sink
+        Parameters
+        ----------
+        path : export file (xlsx, csv, parquet, feather), None when not requested
+        full : every expiry and strike of each ticker
+        """
+        self._report(0, "Retrieving tickers")
+        stock_price = self.model.retrieve_ticker()  # retrieve the ticker and spot
 
-        logger.info("greeks générated")
+        self._report(10, "Downloading option chains")
+        sink = self.model.export_sink(path) if path else None
+        rows = 0
+        exposures = []  # net greeks of each ticker
+        chunks = self.model.iter_option(
+            stock_price,
+            progress=lambda done, total: self._progress.put(
+                (10 + 85 * done / total, f"Option chains {done}/{total}")
+            ),
+            cancel=self._cancel,
+            full=full,
+        )  # retrieve option data from yahoo finance
+        try:
+            for chunk in chunks:
+                # single-ticker chunks are priced here, a process hop would cost more
+                chunk = chunk.price(self.rf_curve, self.div_curve).data
+                self._chunks.put(chunk)
+                if sink is not None:
+                    sink.append(chunk)
+                rows += len(chunk)
+                exposures.append(Rollup(chunk, by=["Ticker"]).frame())
+
+            logger.info("greeks générated")
+            if self._cancel.is_set():
+                raise Cancelled()
+
+            # the rows are already written, close the file
+            if sink is not None:
+                self._report(95, "Finishing the export")
+                sink.close()
+        except Exception as e:
+            if sink is None:
+                raise
+            # an open writer would leave a truncated, unreadable file
+            sink.abort()
+            if isinstance(e, Cancelled):
+                raise Cancelled(f"{path} not written") from e
+            raise RuntimeError(f"{e}, {path} not written") from e
+
+        self._report(100, "Done")
+        exposure = pd.concat(exposures) if exposures else pd.DataFrame()
+        return {"rows": rows, "path": path, "exposure": exposure}
+
+    def _show_chunk(self, chunk: pd.DataFrame):
+        """
+        Tk side of the streaming: open the table on the first chunk, append the others
+        """
+        with span("table_render", items=len(chunk)):
+            if self._table_open:
+                self.view.append_pdtable(data=chunk)
+            else:
+                self.view.manage_pdtable(data=chunk)
+                self._table_open = True
+
+    def _portfolio_done(self, result: dict):
+        logger.info(f"{result['rows']} options priced")
+        exposure = result["exposure"]
+        if len(exposure):
+            total = exposure.sum()
+            logger.info(f"net exposures by ticker:\n{exposure}")
+            self.view.update_progress(
+                100,
+                f"Net delta {total['Net Delta']:,.0f}, gamma {total['Net Gamma']:,.1f}, "
+                f"vega {total['Net Vega']:,.0f}, theta {total['Net Theta']:,.0f}",
+            )
+        logger.info(f"stage timings: {metrics.summary()}")
+        metrics.dump()
+        if result["path"]:
+            self.view.info_msg(f"Portfolio exported to {result['path']}")
 
-        # generate an Excel with the data
-        if self.view.var2.get():
-            self.model.generate_excel(data=df)
-            self.view.info_msg("Excel generated")
+    def chart(self):
+        self._progress.put((50, "Generating chart"))
+        # the chart is drawn in one call of a worker process, it cannot be cancelled
+        self._submit(
+            self._threads, self._chart_job, self._chart_done, cancellable=False
+        )
 
-        # generate second window with the dataframe
-        self.view.manage_pdtable(data=df)
+    def _chart_job(self):
+        with span("chart") as record:
+            self._processes.submit(_build_chart, self.model).result()
+        return record
 
-    def chart(self):
-        self.view.option_chart(self.model)
+    def _chart_done(self, _):
+        self.view.update_progress(100, "Done")
         self.view.info_msg("Chart generated")
 
+    def shutdown(self):
+        self._cancel.set()
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        self._processes.shutdown(wait=False, cancel_futures=True)
+
 
 class Controller:
     def __init__(self, model, view):
         self.view = view
         self.model = model
-        self.min_controller = MinorController(model, self.view.minor_frame)
-        self.major_controller = MajorController(model, self.view.major_frame)
+        curves = default_curves()
+        self.min_controller = MinorController(model, self.view.minor_frame, curves)
+        self.major_controller = MajorController(model, self.view.major_frame, curves)
 
     def start(self):
         self.view.mainloop()
+        self.major_controller.shutdown()
@@ -0,0 +1,100 @@
+import logging
+import os
+
+import numpy as np
+
+try:
+    import tomllib
+except ImportError:  # python < 3.11
+    tomllib = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RF = 0.05
+DEFAULT_DIV = 0.04
+
+
+class Curve:
+    """
+    Term structure of a continuously compounded rate (risk-free rate or dividend
+    yield). Interpolation is linear in rate x time (piecewise flat forwards), the
+    rate is flat before the first and after the last tenor
+    Attributes
+    ==========
+    tenors: pillars in years
+    rates: zero rates at the pillars
+    name: label of the curve
+
+    """
+
+    def __init__(self, tenors, rates, name: str = ""):
+        tenors = np.atleast_1d(np.asarray(tenors, dtype=float))
+        rates = np.atleast_1d(np.asarray(rates, dtype=float))
+        if tenors.shape != rates.shape or not len(tenors):
+            raise ValueError("tenors and rates should have the same non-zero length")
+        order = np.argsort(tenors)
+        self.tenors = tenors[order]
+        self.rates = rates[order]
+        self.name = name
+
+    @classmethod
+    def flat(cls, rate: float, name: str = "") -> "Curve":
+        return cls([1.0], [rate], name)
+
+    def __repr__(self) -> str:
+        pillars = dict(zip(self.tenors.tolist(), self.rates.tolist()))
+        return f"Curve({self.name!r}, {pillars})"
+
+    def rate(self, t) -> np.ndarray:
+        """
+        :param t: time(s) to expiry in years
+        :return: zero rate(s) at t
+        """
+        t = np.asarray(t, dtype=float)
+        if len(self.tenors) == 1:
+            return np.full(t.shape, self.rates[0])
+        # linear in r * t between the pillars, flat rate outside
+        inside = np.clip(t, self.tenors[0], self.tenors[-1])
+        rt = np.interp(inside, self.tenors, self.rates * self.tenors)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(inside > 0, rt / inside, self.rates[0])
+
+    def discount(self, t) -> np.ndarray:
+        """
+        :param t: time(s) to expiry in years
+        :return: discount factor(s) exp(-r(t) t)
+        """
+        t = np.asarray(t, dtype=float)
+        return np.exp(-self.rate(t) * t)
+
+
+def load_config(path: str = "config.toml") -> dict:
+    """
+    :return: the settings of config.toml, empty when the file or tomllib is missing
+    """
+    if tomllib is None or not os.path.exists(path):
+        logger.warning(f"{path} not read, default settings used")
+        return {}
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+def default_curves(config: dict = None) -> tuple:
+    """
+    Risk-free and dividend curves of the configuration: [curves] pillars when given,
+    flat [model] rf and div otherwise
+    :param config: settings, config.toml by default
+    :return: (risk-free curve, dividend curve)
+    """
+    config = load_config() if config is None else config
+    model = config.get("model", {})
+    pillars = config.get("curves", {})
+    curves = []
+    for key, default in [("rf", DEFAULT_RF), ("div", DEFAULT_DIV)]:
+        if f"{key}_tenors" in pillars:
+            curves.append(
+                Curve(pillars[f"{key}_tenors"], pillars[f"{key}_rates"], name=key)
+            )
+        else:
+            curves.append(Curve.flat(model.get(key, default), name=key))
+    return tuple(curves)
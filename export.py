@@ -0,0 +1,221 @@
+import logging
+import os
+from abc import ABC, abstractmethod
+
+import openpyxl
+import pandas as pd
+
+from instrumentation import span
+
+logger = logging.getLogger(__name__)
+
+
+class Sink(ABC):
+    """
+    Output file filled chunk by chunk: each chunk is written in row batches and
+    released, memory stays flat whatever the size of the book
+    Attributes
+    ==========
+    path: location of the file
+    batch_size: number of rows written at once
+
+    """
+
+    def __init__(self, path: str, batch_size: int = 50_000):
+        self.path = path
+        self.batch_size = batch_size
+        self.rows = 0
+
+    def append(self, data: pd.DataFrame):
+        with span("export", items=len(data)):
+            for start in range(0, len(data), self.batch_size):
+                self._write(data.iloc[start : start + self.batch_size])
+                self.rows += min(self.batch_size, len(data) - start)
+
+    @abstractmethod
+    def _write(self, batch: pd.DataFrame):
+        """
+        :param batch: rows to add to the file
+        """
+
+    def close(self):
+        pass
+
+    def abort(self):
+        """
+        Close the file after a failure or a cancel and remove it, a partial file
+        would not be readable
+        """
+        try:
+            self.close()
+        finally:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        logger.warning(f"partial export {self.path} removed")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class CsvSink(Sink):
+    """
+    CSV file, each batch is appended to the file
+    """
+
+    def _write(self, batch: pd.DataFrame):
+        batch.to_csv(
+            self.path, mode="a" if self.rows else "w", header=not self.rows, index=False
+        )
+
+
+class _ArrowSink(Sink):
+    """
+    Common part of the Arrow based files, the schema is fixed by the first batch
+    """
+
+    # categoricals kept as dictionaries, else written as plain values
+    dictionaries = True
+
+    def __init__(self, path: str, batch_size: int = 50_000):
+        super().__init__(path, batch_size)
+
+        # private
+        self._writer = None
+        self._schema = None
+
+    def _field(self, field):
+        import pyarrow as pa
+
+        if not pa.types.is_dictionary(field.type):
+            return field
+        if self.dictionaries:
+            # int32 indices whatever the number of categories of the first batch
+            return pa.field(
+                field.name, pa.dictionary(pa.int32(), field.type.value_type)
+            )
+        return pa.field(field.name, field.type.value_type)
+
+    def _table(self, batch: pd.DataFrame):
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(batch, preserve_index=False)
+        if self._writer is None:
+            self._schema = pa.schema([self._field(f) for f in table.schema])
+            self._writer = self._open(self._schema)
+        return table.cast(self._schema)
+
+    @abstractmethod
+    def _open(self, schema):
+        """
+        :param schema: arrow schema of the file
+        :return: writer with write_table() and close()
+        """
+
+    def _write(self, batch: pd.DataFrame):
+        table = self._table(batch)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer, writer = None, self._writer
+            writer.close()
+
+
+class ParquetSink(_ArrowSink):
+    """
+    Parquet file, one row group by batch
+    """
+
+    def _open(self, schema):
+        import pyarrow.parquet as pq
+
+        return pq.ParquetWriter(self.path, schema)
+
+
+class FeatherSink(_ArrowSink):
+    """
+    Arrow IPC file (Feather v2), readable with pd.read_feather or memory mapped.
+    The file format cannot replace a dictionary between batches, categoricals are
+    written as plain values
+    """
+
+    dictionaries = False
+
+    def _open(self, schema):
+        import pyarrow as pa
+
+        return pa.ipc.new_file(self.path, schema)
+
+
+class ExcelSink(Sink):
+    """
+    Write-only Excel workbook, rows are streamed to the file instead of being held
+    in a dataframe
+    Attributes
+    ==========
+    path: location of the Excel file
+    sheet_name: name of the sheet
+
+    """
+
+    def __init__(
+        self, path: str, sheet_name: str = "Portfolio", batch_size: int = 50_000
+    ):
+        super().__init__(path, batch_size)
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet(sheet_name)
+
+    def _write(self, batch: pd.DataFrame):
+        if self.rows == 0:
+            self.sheet.append(list(batch.columns))
+        values = batch.astype(object).where(batch.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            self.sheet.append(row)
+
+    def close(self):
+        self.workbook.save(self.path)
+
+    def abort(self):
+        # nothing is written to path before close(), an existing file is kept, the
+        # rows spooled by the sheet are closed and left to openpyxl's cleanup
+        self.sheet.close()
+        logger.warning(f"export to {self.path} dropped")
+
+
+# sink by file extension
+FORMATS = {
+    ".csv": CsvSink,
+    ".parquet": ParquetSink,
+    ".feather": FeatherSink,
+    ".arrow": FeatherSink,
+    ".xlsx": ExcelSink,
+}
+
+
+def sink_for(path: str, **kwargs) -> Sink:
+    """
+    :param path: output file, the format follows the extension (csv, parquet,
+        feather/arrow, xlsx)
+    :return: sink to fill with append() and close()
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in FORMATS:
+        raise ValueError(f"unsupported export format {ext}, use one of {list(FORMATS)}")
+    return FORMATS[ext](path, **kwargs)
+
+
+def export(data: pd.DataFrame, path: str, **kwargs) -> int:
+    """
+    Write a whole dataframe through the sink matching the extension of path
+    :return: number of rows written
+    """
+    with sink_for(path, **kwargs) as sink:
+        sink.append(data)
+    logger.info(f"{sink.rows} rows exported to {path}")
+    return sink.rows
@@ -0,0 +1,185 @@
+import cProfile
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+class Metrics:
+    """
+    Collector of the stage spans of a run (duration, item count, peak memory)
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, record: dict):
+        with self._lock:
+            self.spans.append(record)
+
+    def summary(self) -> dict:
+        """
+        :return: total duration and items by stage
+        """
+        stages = {}
+        with self._lock:
+            for record in self.spans:
+                stage = stages.setdefault(
+                    record["stage"], {"calls": 0, "seconds": 0.0, "items": 0}
+                )
+                stage["calls"] += 1
+                stage["seconds"] += record["seconds"]
+                stage["items"] += record.get("items") or 0
+        return stages
+
+    def dump(self, path: str = "metrics.jsonl", reset: bool = True):
+        """
+        Append the spans of the run as one JSON line
+        :param path: JSON lines file
+        :param reset: clear the spans once written
+        """
+        with self._lock:
+            spans, self.spans = self.spans, ([] if reset else self.spans)
+        run = {
+            "run": datetime.now().isoformat(timespec="seconds"),
+            "spans": spans,
+        }
+        with open(path, "a") as f:
+            f.write(json.dumps(run) + "\n")
+
+
+# collector shared by the models and controllers
+metrics = Metrics()
+
+
+# spans open in the process, only a span opened alone owns the tracemalloc peak
+_open_spans = 0
+_open_lock = threading.Lock()
+
+
+def _memory() -> int:
+    """
+    :return: traced allocations in bytes when tracemalloc runs, else peak process RSS
+    """
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    if resource is not None:
+        # kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return None
+
+
+def _peak_delta(start: int, owner: bool) -> int:
+    """
+    Memory taken by a span: traced peak above the start for the span owning the
+    peak, growth of the traced allocations for the spans running alongside (the
+    peak is process-wide), growth of the peak RSS without tracemalloc
+    """
+    if start is None:
+        return None
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        return max((peak if owner else current) - start, 0)
+    return _memory() - start
+
+
+@contextmanager
+def span(stage: str, items: int = None):
+    """
+    Time a stage of the pipeline, the record yielded can be completed (e.g. items).
+    peak_bytes is the memory taken by the stage (see _peak_delta)
+    :param stage: name of the stage
+    :param items: number of items processed (tickers, contracts...)
+    """
+    global _open_spans
+    record = {"stage": stage, "start": time.time(), "items": items}
+    with _open_lock:
+        # a reset would wipe the peak of the spans already open (other threads,
+        # enclosing spans)
+        owner = _open_spans == 0
+        _open_spans += 1
+    if owner and tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    memory = _memory()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        record["peak_bytes"] = _peak_delta(memory, owner)
+        with _open_lock:
+            _open_spans -= 1
+        metrics.add(record)
+        logger.debug(
+            f"{stage}: {record['seconds']:.4f}s, {record['items']} items, "
+            f"peak {record['peak_bytes']} bytes"
+        )
+
+
+def timed(stage: str = None, items=None):
+    """
+    Decorator recording a span for each call
+    :param stage: name of the stage, the function name by default
+    :param items: optional callable computing the item count from the result (e.g. len)
+    """
+
+    def decorator(func):
+        name = stage or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name) as record:
+                result = func(*args, **kwargs)
+                if items is not None:
+                    record["items"] = items(result)
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def profile_run(prefix: str = "profile", enabled: bool = None):
+    """
+    Opt-in cProfile and tracemalloc capture of a run (BSM_PROFILE=1 in the environment)
+    :param prefix: files written: <prefix>_<time>.prof and <prefix>_<time>_memory.txt
+    :param enabled: force the capture on or off, BSM_PROFILE decides when None
+    """
+    if enabled is None:
+        enabled = os.environ.get("BSM_PROFILE", "") not in ("", "0")
+    if not enabled:
+        yield
+        return
+
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    profiler = cProfile.Profile()
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(f"{prefix}_{stamp}.prof")
+        snapshot = tracemalloc.take_snapshot()
+        with open(f"{prefix}_{stamp}_memory.txt", "w") as f:
+            for stat in snapshot.statistics("lineno")[:50]:
+                f.write(f"{stat}\n")
+        if started:
+            tracemalloc.stop()
+        logger.info(f"profile written to {prefix}_{stamp}.prof")
@@ -0,0 +1,191 @@
+import logging
+
+import numpy as np
+
+from instrumentation import timed
+from models import _option_flags
+
+logger = logging.getLogger(__name__)
+
+
+class Lattice:
+    """
+    Binomial (Cox-Ross-Rubinstein) or trinomial (Boyle) tree pricer with early exercise.
+    Many contracts are priced at once: the backward induction is vectorized over the
+    contracts and the nodes of a time step, only the current layer is kept in memory
+    (O(steps) per contract). A continuous dividend yield q and discrete cash dividends
+    (escrowed dividend model) are supported
+    Attributes
+    ==========
+    steps: number of time steps of the tree
+    method: "binomial" or "trinomial"
+    american: early exercise allowed at every node
+    batch_size: number of contracts priced together (small batches stay in the CPU cache)
+
+    """
+
+    def __init__(
+        self,
+        steps: int = 500,
+        method: str = "binomial",
+        american: bool = True,
+        batch_size: int = 128,
+    ):
+        if method not in ("binomial", "trinomial"):
+            raise ValueError(f"unknown method {method}")
+        if steps < 2:
+            raise ValueError("the tree needs at least 2 steps")
+        self.steps = steps
+        self.method = method
+        self.american = american
+        self.batch_size = batch_size
+
+    @staticmethod
+    def _escrow(spot, t, r, dividends, at):
+        """
+        Present value at time `at` of the cash dividends paid between `at` and maturity
+        :param dividends: list of (time in years, amount) shared by all the contracts
+        :return: array shaped like `at`
+        """
+        if not dividends:
+            return 0.0
+        pv = np.zeros(np.broadcast(at, t).shape)
+        for when, amount in dividends:
+            paid = (when > at) & (when <= t)
+            pv = pv + np.where(paid, amount * np.exp(-r * (when - at)), 0.0)
+        return pv
+
+    def _induction(self, strike, spot, t, sigma, r, q, is_call, dividends):
+        """
+        Backward induction for a batch of contracts (1-D arrays)
+        :return: (root values, values of the layers 1 and 2, their spots, dt)
+        """
+        steps = self.steps
+        col = (slice(None), None)
+        dt = t / steps
+        sign = np.where(is_call, 1.0, -1.0)[col]
+        carry = np.exp((r - q) * dt)
+        disc = np.exp(-r * dt)
+
+        # the tree is built on the spot net of the escrowed dividends
+        base = spot - self._escrow(spot, t, r, dividends, 0.0)
+
+        if self.method == "binomial":
+            move = sigma * np.sqrt(dt)
+            p_up = (carry - np.exp(-move)) / (np.exp(move) - np.exp(-move))
+            probs = [1 - p_up, p_up]
+            width = 1
+        else:
+            move = sigma * np.sqrt(2 * dt)
+            half = sigma * np.sqrt(dt / 2)
+            den = np.exp(half) - np.exp(-half)
+            p_up = ((np.sqrt(carry) - np.exp(-half)) / den) ** 2
+            p_down = ((np.exp(half) - np.sqrt(carry)) / den) ** 2
+            probs = [p_down, 1 - p_up - p_down, p_up]
+            width = 2
+
+        # binomial: node j at (2j - i) moves, trinomial: node k at (k - i) moves,
+        # the growth factors are computed once and sliced at every step
+        grow = np.exp(np.arange(width * steps + 1)[None, :] * (move * 2 / width)[col])
+
+        def spots(i):
+            return (base * np.exp(-i * move))[col] * grow[:, : width * i + 1]
+
+        def exercise(i, s):
+            escrow = self._escrow(spot, t, r, dividends, i * dt)
+            if dividends:
+                escrow = escrow[col]
+            return np.maximum(sign * (s + escrow - strike[col]), 0)
+
+        values = exercise(steps, spots(steps))
+        probs = [p[col] for p in probs]
+        disc = disc[col]
+        layers = {}
+        for i in range(steps - 1, -1, -1):
+            # in place on a shrinking view of the layer: no new node array per step
+            nodes = width * i + 1
+            step = probs[-1] * values[:, width : width + nodes]
+            for j in range(width - 1, -1, -1):
+                step += probs[j] * values[:, j : j + nodes]
+            values = values[:, :nodes]
+            np.multiply(step, disc, out=values)
+            if self.american:
+                np.maximum(values, exercise(i, spots(i)), out=values)
+            if i <= 2:
+                layers[i] = (values.copy(), spots(i))
+        return values[:, 0], layers, dt
+
+    def _batches(self, strike, spot, t, sigma, option_type, r, q):
+        arrays = np.broadcast_arrays(
+            *(
+                np.atleast_1d(np.asarray(x, dtype=float))
+                for x in (strike, spot, t, sigma, r, q)
+            )
+        )
+        is_call, _ = _option_flags(option_type)
+        is_call = np.broadcast_to(is_call, arrays[0].shape)
+        for start in range(0, arrays[0].size, self.batch_size):
+            rows = slice(start, start + self.batch_size)
+            yield [a[rows] for a in arrays] + [is_call[rows]]
+
+    @timed("lattice_price", items=len)
+    def price(
+        self, strike, spot, t, sigma, option_type, r=0.05, q=0.04, dividends=None
+    ) -> np.ndarray:
+        """
+        :param option_type: type of each option, Call or Put (case insensitive)
+        :param dividends: optional list of (time in years, cash amount)
+        :return: prices of the options
+        """
+        prices = [
+            self._induction(k, s, tt, v, rr, qq, c, dividends)[0]
+            for k, s, tt, v, rr, qq, c in self._batches(
+                strike, spot, t, sigma, option_type, r, q
+            )
+        ]
+        return np.concatenate(prices) if prices else np.array([])
+
+    @timed("lattice_greeks")
+    def greeks(
+        self, strike, spot, t, sigma, option_type, r=0.05, q=0.04, dividends=None
+    ) -> dict:
+        """
+        Price and greeks, same units as the analytic kernel (vega and rho per 1%,
+        theta per calendar day). Delta, gamma and theta are read on the tree, vega and
+        rho by central bumps
+        :return: dict of arrays with price, delta, gamma, vega, theta and rho
+        """
+        out = {k: [] for k in ["price", "delta", "gamma", "vega", "theta", "rho"]}
+        for k, s, tt, v, rr, qq, c in self._batches(
+            strike, spot, t, sigma, option_type, r, q
+        ):
+            price, layers, dt = self._induction(k, s, tt, v, rr, qq, c, dividends)
+            (v1, s1), (v2, s2) = layers[1], layers[2]
+            if self.method == "binomial":
+                delta = (v1[:, 1] - v1[:, 0]) / (s1[:, 1] - s1[:, 0])
+                up = (v2[:, 2] - v2[:, 1]) / (s2[:, 2] - s2[:, 1])
+                down = (v2[:, 1] - v2[:, 0]) / (s2[:, 1] - s2[:, 0])
+                gamma = (up - down) / (0.5 * (s2[:, 2] - s2[:, 0]))
+                theta = (v2[:, 1] - price) / (2 * dt)
+            else:
+                delta = (v1[:, 2] - v1[:, 0]) / (s1[:, 2] - s1[:, 0])
+                up = (v1[:, 2] - v1[:, 1]) / (s1[:, 2] - s1[:, 1])
+                down = (v1[:, 1] - v1[:, 0]) / (s1[:, 1] - s1[:, 0])
+                gamma = (up - down) / (0.5 * (s1[:, 2] - s1[:, 0]))
+                theta = (v1[:, 1] - price) / dt
+
+            bump = 0.01
+            vega = (
+                self._induction(k, s, tt, v + bump, rr, qq, c, dividends)[0]
+                - self._induction(k, s, tt, v - bump, rr, qq, c, dividends)[0]
+            ) / (2 * bump)
+            rho = (
+                self._induction(k, s, tt, v, rr + bump, qq, c, dividends)[0]
+                - self._induction(k, s, tt, v, rr - bump, qq, c, dividends)[0]
+            ) / (2 * bump)
+
+            for name, value in zip(
+                out, [price, delta, gamma, vega / 100, theta / 365, rho / 100]
+            ):
+                out[name].append(value)
+        return {k: np.concatenate(v) if v else np.array([]) for k, v in out.items()}
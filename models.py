@@ -1,15 +1,187 @@
+import functools
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime
 from random import randrange
 
-import bs4 as bs
 import numpy as np
 import pandas as pd
-import requests
-import yfinance as yf
+from pandas.api.types import union_categoricals
+from scipy.special import ndtr
 from scipy.stats import norm
 
+from curves import Curve
+from export import Sink, export, sink_for
+from instrumentation import span, timed
+from providers import CachedProvider, YahooProvider
+
 logger = logging.getLogger(__name__)
 
+_INV_SQRT_2PI = 1 / np.sqrt(2 * np.pi)
+
+
+def _pdf(x):
+    """standard normal density, without the rv_continuous dispatch of norm.pdf"""
+    return _INV_SQRT_2PI * np.exp(-0.5 * x * x)
+
+
+def _option_flags(option_type) -> tuple:
+    """
+    Map option types (Call/Put, any case) to boolean masks
+    :param option_type: single type or array/column of types
+    :return: (is_call, is_put) boolean arrays
+    """
+    if isinstance(option_type, str):
+        upper = option_type.upper()
+        return upper == "CALL", upper == "PUT"
+    types = pd.Categorical(np.atleast_1d(np.asarray(option_type, dtype=object)))
+    upper = types.categories.astype(str).str.upper()
+    codes = types.codes
+    is_call = np.isin(codes, np.flatnonzero(upper == "CALL"))
+    is_put = np.isin(codes, np.flatnonzero(upper == "PUT"))
+    if np.ndim(option_type) == 0:
+        return is_call[0], is_put[0]
+    return is_call, is_put
+
+
+STATUS = pd.CategoricalDtype(["In the Money", "At the Money", "Out of the Money"])
+
+
+def _status(strike, spot, is_call, is_put) -> pd.Categorical:
+    """
+    Vectorized intrinsic_value status
+    :return: categorical of In/At/Out of the Money
+    """
+    value = strike - spot
+    codes = np.where(
+        (is_call & (value < 0)) | (is_put & (value > 0)), 0, np.where(value == 0, 1, 2)
+    )
+    return pd.Categorical.from_codes(codes, dtype=STATUS)
+
+
+def _invariants(strike, t, sigma, r, q, disc_r=None, disc_q=None) -> dict:
+    """
+    Spot independent terms of the BSM kernel (log strike, sqrt(t), sigma*sqrt(t),
+    drift, discount factors), they can be cached while the spot moves
+    :param disc_r: optional discount factors exp(-r t), e.g. from discounting()
+    :param disc_q: optional dividend discount factors exp(-q t)
+    :return: dict of arrays
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sqrt_t = np.sqrt(t)
+        disc_r = np.exp(-r * t) if disc_r is None else disc_r
+        disc_q = np.exp(-q * t) if disc_q is None else disc_q
+        return {
+            "strike": strike,
+            "t": t,
+            "sigma": sigma,
+            "r": r,
+            "q": q,
+            "log_strike": np.log(strike),
+            "sqrt_t": sqrt_t,
+            "vol_t": sigma * sqrt_t,
+            "drift": (r - q + 0.5 * sigma * sigma) * t,
+            "disc_q": disc_q,
+            "disc_r": disc_r,
+            "strike_r": strike * disc_r,
+        }
+
+
+def _spot_greeks(spot, inv: dict, is_call, is_put, rounding: bool = True) -> dict:
+    """
+    Spot dependent part of the BSM kernel, the invariants come from _invariants
+    :return: dict with price, delta, gamma, vega, theta and rho (NaN for unknown types)
+    """
+    sigma, t, r, q = inv["sigma"], inv["t"], inv["r"], inv["q"]
+    sqrt_t, vol_t = inv["sqrt_t"], inv["vol_t"]
+    disc_q, strike_r = inv["disc_q"], inv["strike_r"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d1 = (np.log(spot) - inv["log_strike"] + inv["drift"]) / vol_t
+        d2 = d1 - vol_t
+        nd1 = ndtr(d1)
+        nd2 = ndtr(d2)
+        pdf_d1 = _pdf(d1)
+        spot_q = spot * disc_q
+
+        # put side through the symmetry N(-x) = 1 - N(x)
+        call = spot_q * nd1 - strike_r * nd2
+        put = call - spot_q + strike_r
+        decay = pdf_d1 * spot_q * sigma / (2 * sqrt_t)
+        theta_call = q * spot_q * nd1 - r * strike_r * nd2 - decay
+        theta_put = theta_call + r * strike_r - q * spot_q
+        rho_call = strike_r * t * nd2
+
+        greeks = {
+            "price": np.where(is_call, call, np.where(is_put, put, np.nan)),
+            "delta": np.where(
+                is_call, disc_q * nd1, np.where(is_put, disc_q * (nd1 - 1), np.nan)
+            ),
+            "gamma": disc_q * pdf_d1 / (spot * vol_t),
+            "vega": spot_q * sqrt_t * pdf_d1 / 100,
+            "theta": np.where(is_call, theta_call, np.where(is_put, theta_put, np.nan))
+            / 365,
+            "rho": np.where(
+                is_call, rho_call, np.where(is_put, rho_call - strike_r * t, np.nan)
+            )
+            / 100,
+        }
+
+    if rounding:
+        greeks = {k: np.round(v, 3 if k == "price" else 4) for k, v in greeks.items()}
+    return greeks
+
+
+def _spot_price(spot, inv: dict, is_call, is_put) -> np.ndarray:
+    """
+    Price-only side of _spot_greeks for the callers that drop the greeks (scenario
+    revaluation, bracketing), no density, theta, rho or rounding
+    :return: unrounded prices (NaN for unknown types)
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d1 = (np.log(spot) - inv["log_strike"] + inv["drift"]) / inv["vol_t"]
+        spot_q = spot * inv["disc_q"]
+        call = spot_q * ndtr(d1) - inv["strike_r"] * ndtr(d1 - inv["vol_t"])
+        return np.where(
+            is_call,
+            call,
+            np.where(is_put, call - spot_q + inv["strike_r"], np.nan),
+        )
+
+
+def _price(
+    strike, spot, t, sigma, r, q, is_call, is_put, disc_r=None, disc_q=None
+) -> np.ndarray:
+    """
+    BSM prices without the greeks
+    :return: unrounded prices (NaN for unknown types)
+    """
+    inv = _invariants(strike, t, sigma, r, q, disc_r, disc_q)
+    return _spot_price(spot, inv, is_call, is_put)
+
+
+def _greeks(
+    strike,
+    spot,
+    t,
+    sigma,
+    r,
+    q,
+    is_call,
+    is_put,
+    rounding: bool = True,
+    disc_r=None,
+    disc_q=None,
+) -> dict:
+    """
+    Fused BSM kernel: every shared term (discount factors, sqrt(t), N(d1), N(d2), n(d1))
+    is evaluated once and reused for the price and all the greeks
+    :param disc_r: optional discount factors computed by the caller (see _invariants)
+    :param disc_q: optional dividend discount factors
+    :return: dict with price, delta, gamma, vega, theta and rho (NaN for unknown types)
+    """
+    inv = _invariants(strike, t, sigma, r, q, disc_r, disc_q)
+    return _spot_greeks(spot, inv, is_call, is_put, rounding)
+
 
 class Options:
     """
@@ -25,6 +197,9 @@ class Options:
 
     """
 
+    # source of the market data (constituents, spots and chains), cached locally
+    provider = CachedProvider(YahooProvider())
+
     def __init__(
         self,
         strike: float,
@@ -47,7 +222,7 @@ class Options:
 
     @staticmethod
     def n(x):
-        return norm.cdf(x)
+        return ndtr(x)
 
     def d1(self) -> float:
         return (
@@ -106,9 +281,7 @@ class Options:
         gamma = (
             np.exp(-self.q * self.t)
             * norm.pdf(self._d1)
-            / self.spot
-            * self.sigma
-            * np.sqrt(self.t)
+            / (self.spot * self.sigma * np.sqrt(self.t))
         )
         return gamma.round(4)
 
@@ -128,7 +301,7 @@ class Options:
 
     def theta(self, option_type: str) -> float:
         """
-        Vega measures the change in the option price per one calendar day (or 1/365 of a year)
+        Theta measures the change in the option price per one calendar day (or 1/365 of a year)
         :return: theta of the option
         """
         try:
@@ -140,8 +313,7 @@ class Options:
                     * self.spot
                     * self.sigma
                     * np.exp(-self.q * self.t)
-                    / 2
-                    * np.sqrt(self.t)
+                    / (2 * np.sqrt(self.t))
                 ) / 365
             elif option_type == "PUT":
                 theta = (
@@ -151,8 +323,7 @@ class Options:
                     * self.spot
                     * self.sigma
                     * np.exp(-self.q * self.t)
-                    / 2
-                    * np.sqrt(self.t)
+                    / (2 * np.sqrt(self.t))
                 ) / 365
             return theta.round(4)
         except Exception as e:
@@ -161,6 +332,87 @@ class Options:
                 f"Option type missing, please enter the option type. It should be a string"
             )
 
+    def all_greeks(self, option_type: str, rounding: bool = True) -> dict:
+        """
+        Price and every greek of the option from a single evaluation of the shared terms
+        :param option_type: whether it is a Call or a Put
+        :param rounding: round the outputs like bsm/delta/... do, disable it in hot loops
+        :return: dict with price, delta, gamma, vega, theta and rho
+        """
+        is_call, is_put = _option_flags(option_type)
+        greeks = _greeks(
+            self.strike,
+            self.spot,
+            self.t,
+            self.sigma,
+            self.r,
+            self.q,
+            is_call,
+            is_put,
+            rounding,
+        )
+        return {k: float(v) for k, v in greeks.items()}
+
+    @staticmethod
+    def greeks_batch(
+        strike,
+        spot,
+        t,
+        sigma,
+        option_type,
+        r=0.05,
+        q=0.04,
+        rounding: bool = True,
+    ) -> dict:
+        """
+        Batched variant of all_greeks, every input can be an array or a dataframe column
+        :param option_type: type of each option, Call or Put (case insensitive)
+        :param rounding: round the outputs, disable it in hot loops
+        :return: dict of arrays with price, delta, gamma, vega, theta and rho
+        """
+        is_call, is_put = _option_flags(option_type)
+        return _greeks(
+            np.asarray(strike, dtype=float),
+            np.asarray(spot, dtype=float),
+            np.asarray(t, dtype=float),
+            np.asarray(sigma, dtype=float),
+            np.asarray(r, dtype=float),
+            np.asarray(q, dtype=float),
+            is_call,
+            is_put,
+            rounding,
+        )
+
+    @staticmethod
+    def grid(spot, strike, t, sigma, r=0.05, q=0.04, rounding: bool = False) -> dict:
+        """
+        Price and greeks over a spot x strike x maturity x volatility mesh in one array
+        operation, calls and puts together
+        :param spot: spot axis (1-D)
+        :param strike: strike axis (1-D)
+        :param t: maturity axis, in year fractions (1-D)
+        :param sigma: volatility axis (1-D)
+        :param rounding: round the outputs like bsm/delta/... do
+        :return: dict {"CALL": greeks, "PUT": greeks}, each greek has the shape
+            (len(spot), len(strike), len(t), len(sigma))
+        """
+        axes = [
+            np.atleast_1d(np.asarray(x, dtype=float)) for x in (spot, strike, t, sigma)
+        ]
+        shape = [len(x) for x in axes]
+        spot, strike, t, sigma = (
+            x.reshape([1] + [-1 if j == i else 1 for j in range(4)])
+            for i, x in enumerate(axes)
+        )
+        # leading axis of size 2: calls then puts
+        is_call = np.array([True, False]).reshape(2, 1, 1, 1, 1)
+        greeks = _greeks(strike, spot, t, sigma, r, q, is_call, ~is_call, rounding)
+        greeks = {k: np.broadcast_to(v, [2] + shape) for k, v in greeks.items()}
+        return {
+            option_type: {k: v[i] for k, v in greeks.items()}
+            for i, option_type in enumerate(["CALL", "PUT"])
+        }
+
     def intrinsic_value(self, option_type: str) -> list:
         """
         Give an approximate intrinsic value of the option and the status based on the intrinsic value
@@ -178,85 +430,744 @@ class Options:
         return [status, round(value, 2)]
 
     @staticmethod
-    def retrieve_ticker() -> list:
+    @functools.lru_cache(maxsize=1024)
+    def _quote(option_type, strike, spot, t, sigma, r, q) -> tuple:
+        op = Options(strike, spot, t, sigma, r, q)
+        status, value = op.intrinsic_value(option_type)
+        return (
+            ("price", op.bsm(option_type)),
+            ("delta", op.delta(option_type)),
+            ("gamma", op.gamma()),
+            ("vega", op.vega()),
+            ("theta", op.theta(option_type)),
+            ("status", status),
+            ("value", value),
+        )
+
+    @staticmethod
+    def quote(
+        option_type: str,
+        strike: float,
+        spot: float,
+        t: float,
+        sigma: float,
+        r: float = 0.05,
+        q: float = 0.04,
+    ) -> dict:
+        """
+        Price, greeks and status of a single option, memoized on the normalized inputs
+        (type in upper case, numbers as floats rounded to 10 decimals) so that going
+        back to a contract already seen costs a dictionary lookup
+        :return: dict with price, delta, gamma, vega, theta, status and (intrinsic) value
+        """
+        key = [round(float(x), 10) for x in (strike, spot, t, sigma, r, q)]
+        return dict(Options._quote(option_type.strip().upper(), *key))
+
+    @staticmethod
+    def quote_cache_info():
+        """
+        :return: hits, misses, maxsize and currsize of the single option cache
+        """
+        return Options._quote.cache_info()
+
+    @staticmethod
+    @timed("pricing", items=len)
+    def price_portfolio(
+        strike,
+        spot,
+        t,
+        sigma,
+        option_type,
+        r: float = 0.05,
+        q: float = 0.04,
+    ) -> pd.DataFrame:
         """
-        get sp100 stock ticker from wikipedia
-        :return: list of stocks ticker
+        Vectorized valuation of a whole portfolio in a single pass (price, greeks and status)
+        :param strike: strike prices (array or dataframe column)
+        :param spot: spot prices of the underlying
+        :param t: times to maturity (in year fractions)
+        :param sigma: volatilities
+        :param option_type: type of each option, Call or Put (case insensitive)
+        :param r: risk-free rate(s)
+        :param q: dividend yield(s)
+        :return: dataframe with Price, Delta, Gamma, Vega, Theta, Rho and Status columns
         """
+        index = strike.index if isinstance(strike, pd.Series) else None
+        strike = np.asarray(strike, dtype=float)
+        spot = np.asarray(spot, dtype=float)
+        is_call, is_put = _option_flags(option_type)
+        greeks = _greeks(
+            strike,
+            spot,
+            np.asarray(t, dtype=float),
+            np.asarray(sigma, dtype=float),
+            np.asarray(r, dtype=float),
+            np.asarray(q, dtype=float),
+            is_call,
+            is_put,
+        )
+
+        status = _status(strike, spot, is_call, is_put)
+
+        return pd.DataFrame(
+            {
+                "Price": greeks["price"],
+                "Delta": greeks["delta"],
+                "Gamma": greeks["gamma"],
+                "Vega": greeks["vega"],
+                "Theta": greeks["theta"],
+                "Rho": greeks["rho"],
+                "Status": status,
+            },
+            index=index,
+        )
+
+    @staticmethod
+    @timed("implied_vol", items=len)
+    def implied_vol(
+        price,
+        strike,
+        spot,
+        t,
+        option_type,
+        r=0.05,
+        q=0.04,
+        sigma0=None,
+        tol: float = 1e-8,
+        vol_tol: float = 1e-6,
+        max_iter: int = 100,
+        max_widen: int = 10,
+    ) -> pd.DataFrame:
+        """
+        Back out implied volatilities from market prices for a whole chain at once.
+        Safeguarded Newton: every contract keeps a [low, high] bracket around the root and
+        falls back to a bisection step whenever the Newton step leaves it (or vega vanishes)
+        :param price: market prices of the options
+        :param option_type: type of each option, Call or Put (case insensitive)
+        :param sigma0: optional warm start (e.g. previous snapshot's vols), NaN entries use the default guess
+        :param tol: tolerance on the price error
+        :param vol_tol: tolerance on the volatility, estimated by price error / vega (a
+            price within tol says little when vega vanishes) or by the bracket width
+        :param max_iter: maximum number of iterations
+        :param max_widen: maximum number of doublings of the initial 500% upper bound
+        :return: dataframe with Implied Vol, Converged and Iterations columns
+        """
+        index = price.index if isinstance(price, pd.Series) else None
+        price, strike, spot, t, r, q = np.broadcast_arrays(
+            *(
+                np.atleast_1d(np.asarray(x, dtype=float))
+                for x in (price, strike, spot, t, r, q)
+            )
+        )
+        is_call, is_put = np.broadcast_arrays(*_option_flags(option_type), price)[:2]
+        n = price.size
+
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            # no-arbitrage bounds, prices outside them have no implied volatility
+            spot_q = spot * np.exp(-q * t)
+            strike_r = strike * np.exp(-r * t)
+            lower = np.maximum(
+                np.where(is_call, spot_q - strike_r, strike_r - spot_q), 0
+            )
+            upper = np.where(is_call, spot_q, strike_r)
+            valid = (is_call | is_put) & (t > 0) & (price > lower) & (price < upper)
 
-        # logger.log(level=logging.DEBUG)
+            # Brenner-Subrahmanyam guess, replaced by the warm start when available
+            sigma = np.clip(np.sqrt(2 * np.pi / t) * price / spot, 0.05, 2.0)
+            if sigma0 is not None:
+                sigma0 = np.broadcast_to(np.asarray(sigma0, dtype=float), (n,))
+                warm = np.isfinite(sigma0) & (sigma0 > 0)
+                sigma = np.where(warm, sigma0, sigma)
 
-        # get the ticker from wikipedia ETF S&P 100 page
-        r = requests.get("https://en.wikipedia.org/wiki/S%26P_100#Components")
-        soup = bs.BeautifulSoup(r.text, "lxml")
-        table = soup.find("table", {"class": "wikitable", "id": "constituents"})
-        tickers = []
+        low = np.full(n, 1e-6)
+        high = np.full(n, 5.0)
+        converged = np.zeros(n, dtype=bool)
+        iterations = np.zeros(n, dtype=int)
+        active = np.flatnonzero(valid)
 
-        for i in table.findAll("tr")[1:]:
-            for x in i.findAll("td"):
-                ticker = x.get_text()
-                tickers.append(ticker)
+        # the upper bound must price above the market, doubled until it does (short
+        # dated OTM quotes can imply more than 500%), contracts never bracketed are
+        # left unconverged at the last bound
+        unbracketed = active
+        for widening in range(max_widen + 1):
+            above = (
+                _price(
+                    strike[unbracketed],
+                    spot[unbracketed],
+                    t[unbracketed],
+                    high[unbracketed],
+                    r[unbracketed],
+                    q[unbracketed],
+                    is_call[unbracketed],
+                    is_put[unbracketed],
+                )
+                > price[unbracketed]
+            )
+            unbracketed = unbracketed[~above]
+            if unbracketed.size == 0 or widening == max_widen:
+                break
+            low[unbracketed] = high[unbracketed]
+            high[unbracketed] *= 2
+        sigma[unbracketed] = high[unbracketed]
+        active = np.setdiff1d(active, unbracketed)
+        # start inside the bracket
+        inside = (sigma[active] > low[active]) & (sigma[active] < high[active])
+        sigma[active] = np.where(
+            inside, sigma[active], 0.5 * (low[active] + high[active])
+        )
+
+        for _ in range(max_iter):
+            if active.size == 0:
                 break
+            greeks = _greeks(
+                strike[active],
+                spot[active],
+                t[active],
+                sigma[active],
+                r[active],
+                q[active],
+                is_call[active],
+                is_put[active],
+                rounding=False,
+            )
+            diff = greeks["price"] - price[active]
+            iterations[active] += 1
+
+            # the price error, plus the rounding of the price itself (about eps x
+            # spot), must also pin the volatility down: a vanishing vega does not
+            noise = np.finfo(float).eps * spot[active]
+            identified = noise < vol_tol * greeks["vega"] * 100
+            done = (np.abs(diff) < tol) & (
+                np.abs(diff) + noise < vol_tol * greeks["vega"] * 100
+            )
+            converged[active[done]] = True
+            high[active] = np.where(diff > 0, sigma[active], high[active])
+            low[active] = np.where(diff < 0, sigma[active], low[active])
+
+            with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+                step = sigma[active] - diff / (greeks["vega"] * 100)
+            outside = (
+                ~np.isfinite(step) | (step <= low[active]) | (step >= high[active])
+            )
+            sigma[active] = np.where(
+                done,
+                sigma[active],
+                np.where(outside, 0.5 * (low[active] + high[active]), step),
+            )
+
+            bracketed = (high[active] - low[active]) < vol_tol
+            converged[active[bracketed & identified]] = True
+            # a flat price that already matches cannot move the bracket any more
+            stuck = (diff == 0) & ~identified
+            active = active[~(done | bracketed | stuck)]
+
+        return pd.DataFrame(
+            {
+                "Implied Vol": np.where(valid, sigma, np.nan),
+                "Converged": converged,
+                "Iterations": iterations,
+            },
+            index=index,
+        )
 
-        tickers = [i.replace("\n", "") for i in tickers]
+    @staticmethod
+    def retrieve_ticker() -> list:
+        """
+        get sp100 stock ticker and their spot from the market data provider
+        :return: list of tuple with stock's ticker and price
+        """
+        with span("constituents") as record:
+            tickers = Options.provider.constituents()
+            record["items"] = len(tickers)
+        with span("spot_download") as record:
+            spots = Options.provider.spots(tickers)
+            record["items"] = len(spots)
+        return [(t, spots[t]) for t in tickers if t in spots]
 
-        # get the spot of each stocks from yahoo finance
-        spots = (
-            yf.download(tickers, interval="1m")["Adj Close"].iloc[-1, :]
-        ).reset_index()
-        while spots.isnull().sum().sum() >= 5:
-            print(f"{spots.isnull().sum().sum()} missing values")
-            spots = (yf.download(tickers)["Adj Close"].iloc[-1, :]).reset_index()
-        stock_price = list(spots.dropna().itertuples(index=False, name=None))
+    @staticmethod
+    def get_spot(ticker: str) -> float:
+        """
+        get spot price of a stock
+        :param ticker: stock ticker
+        :return: spot of the stock
+        """
+        return round(Options.provider.spots([ticker])[ticker], 2)
+
+    @staticmethod
+    def _fetch_chain(ticker: str, spot: float) -> pd.DataFrame:
+        """
+        Download the option chain of one stock on a random expiry
+        :param ticker: stock ticker
+        :param spot: stock price
+        :return: dataframe with the first call and the first put of the chain
+        """
+        maturity = Options.provider.expiries(ticker)
+        if not maturity:
+            raise ValueError("no listed expiry")
 
-        return stock_price
+        # prefer an expiry whose chain is still in the cache
+        cached = [e for e in maturity if Options.provider.is_cached(ticker, e)]
+        candidates = cached or maturity
+        exp = candidates[randrange(len(candidates))]
+        return Options._chain_frame(ticker, spot, exp, first=True)
 
     @staticmethod
-    def get_spot(ticker_list: list) -> float:
+    @timed("chain_download", items=len)
+    def _chain_frame(
+        ticker: str,
+        spot: float,
+        exp: str,
+        filters: "ChainFilter" = None,
+        first: bool = False,
+    ) -> pd.DataFrame:
         """
-        get spot price of a stocks list
-        :param ticker_list: list of stock ticker
-        :return: dataframe with stocks and spots
+        Download the chain of one expiry and build its contracts column-wise, each
+        download is recorded as a chain_download span (get_option and iter_option)
+        :param filters: rows rejected by the filter are dropped before the frame is built
+        :param first: keep only the first call and the first put
+        :return: dataframe with the contracts of the expiry
         """
-        spot = yf.download(ticker_list)["Adj Close"].iloc[-1]
-        return spot.round(2)
+        chain = Options.provider.chain(ticker, exp)
+        sides = []
+        for side in ["calls", "puts"]:
+            opt = chain[side].iloc[:1] if first else chain[side]
+            if filters is not None:
+                opt = opt[filters.mask(opt, spot)]
+            sides.append(opt)
+        calls, puts = sides
+        opt = pd.concat([calls, puts], ignore_index=True)
+        return pd.DataFrame(
+            {
+                "Ticker": ticker,
+                "Spot": spot,
+                "Maturity": exp,
+                "Type": ["call"] * len(calls) + ["put"] * len(puts),
+                "Contract Symbol": opt["contractSymbol"].to_numpy(),
+                "Strike": opt["strike"].to_numpy(),
+                "Volatility": opt["impliedVolatility"].to_numpy(),
+                "Market Price": opt["lastPrice"].to_numpy(),
+                "Volume": opt["volume"].to_numpy(),
+                "Currency": opt["currency"].to_numpy(),
+                # listed equity options deliver 100 shares
+                "Multiplier": 100.0,
+            }
+        )
+
+    @staticmethod
+    def _expiries(ticker: str, filters: "ChainFilter" = None) -> list:
+        maturity = Options.provider.expiries(ticker)
+        if not maturity:
+            raise ValueError("no listed expiry")
+        return maturity if filters is None else filters.expiries(maturity)
 
     @staticmethod
-    def get_option(stock_price) -> pd.DataFrame:
+    def iter_option(
+        stock_price,
+        max_workers: int = 8,
+        progress=None,
+        cancel=None,
+        failures=None,
+        full: bool = False,
+        filters: "ChainFilter" = None,
+    ):
         """
-        Get the option characteristics from yahoo finance (s, k, t, sigma)
+        Stream the option characteristics ticker by ticker, as soon as each chain arrives.
+        Chains are downloaded concurrently through a bounded thread pool (the provider
+        holds the shared http session, timeouts and rate limit), a failing ticker is
+        logged and skipped without aborting the run
         :param stock_price: list of tuple with stock's ticker and price
-        :return: dataframe with the options data
-        """
-        option_data = []
-        for t, s in stock_price:
-            try:
-                maturity = yf.Ticker(str(t)).options
-                exp = maturity[randrange(len(maturity))]
-            except ValueError:
-                continue
-
-            for option_type in ["calls", "puts"]:
-                opt = getattr(yf.Ticker(str(t)).option_chain(exp), option_type)
-                for row in opt.itertuples():
-                    type_op = "call" if option_type == "calls" else "put"
-                    option_data.append(
-                        {
-                            "Ticker": t,
-                            "Spot": s,
-                            "Maturity": exp,
-                            "Type": type_op,
-                            "Contract Symbol": row.contractSymbol,
-                            "Strike": row.strike,
-                            "Volatility": row.impliedVolatility,
-                            "Volume": row.volume,
-                            "Currency": row.currency,
-                        }
+        :param max_workers: number of concurrent downloads
+        :param progress: optional callback(done, total) called after each ticker
+        :param cancel: optional threading.Event, the pending downloads are dropped once set
+        :param failures: optional dict filled with the failing tickers and their error
+        :param full: every strike of every expiry instead of one call and one put on a
+            random expiry
+        :param filters: optional ChainFilter applied while downloading (full mode)
+        :return: generator of Portfolio, one per ticker
+        """
+        if full:
+            yield from Options._iter_full_chain(
+                stock_price, max_workers, progress, cancel, failures, filters
+            )
+            return
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(Options._fetch_chain, t, s): t for t, s in stock_price
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                if cancel is not None and cancel.is_set():
+                    for pending in futures:
+                        pending.cancel()
+                    break
+                if progress is not None:
+                    progress(done, len(futures))
+                ticker = futures[future]
+                try:
+                    option_data = future.result()
+                except Exception as e:
+                    if failures is not None:
+                        failures[ticker] = repr(e)
+                    logger.warning(f"option chain of {ticker} not retrieved: {e}")
+                    continue
+                if len(option_data):
+                    yield Portfolio(option_data)
+
+    @staticmethod
+    def _iter_full_chain(stock_price, max_workers, progress, cancel, failures, filters):
+        """
+        Full-chain side of iter_option: the expiries of all the tickers are listed
+        concurrently, each expiry is then downloaded as its own task in the same pool,
+        a ticker is yielded once all its expiries arrived
+        """
+        spots = dict(stock_price)
+        frames = {}  # chains received by ticker
+        remaining = {}  # expiries still pending by ticker
+
+        def failed(ticker, e):
+            if failures is not None:
+                failures[ticker] = repr(e)
+            logger.warning(f"option chain of {ticker} not retrieved: {e}")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            listing = {executor.submit(Options._expiries, t, filters): t for t in spots}
+            chains = {}
+            for future in as_completed(listing):
+                ticker = listing[future]
+                try:
+                    maturity = future.result()
+                except Exception as e:
+                    failed(ticker, e)
+                    continue
+                frames[ticker], remaining[ticker] = [], len(maturity)
+                for exp in maturity:
+                    task = executor.submit(
+                        Options._chain_frame, ticker, spots[ticker], exp, filters
                     )
+                    chains[task] = ticker
+
+            for done, future in enumerate(as_completed(chains), start=1):
+                if cancel is not None and cancel.is_set():
+                    for pending in chains:
+                        pending.cancel()
                     break
+                if progress is not None:
+                    progress(done, len(chains))
+                ticker = chains[future]
+                remaining[ticker] -= 1
+                if frames[ticker] is None:
+                    # a failed ticker is not yielded, its other expiries are drained
+                    continue
+                try:
+                    frames[ticker].append(future.result())
+                except Exception as e:
+                    failed(ticker, e)
+                    frames[ticker] = None
+                    continue
+                if remaining[ticker]:
+                    continue
+                option_data = pd.concat(frames.pop(ticker), ignore_index=True)
+                if len(option_data):
+                    yield Portfolio(option_data)
 
-        return pd.DataFrame(option_data)
+    @staticmethod
+    def get_option(
+        stock_price,
+        max_workers: int = 8,
+        progress=None,
+        cancel=None,
+        full: bool = False,
+        filters: "ChainFilter" = None,
+    ) -> "Portfolio":
+        """
+        Get the option characteristics from the market data provider (s, k, t, sigma)
+        :param stock_price: list of tuple with stock's ticker and price
+        :param max_workers: number of concurrent downloads
+        :param progress: optional callback(done, total) called after each ticker
+        :param cancel: optional threading.Event, the pending downloads are dropped once set
+        :param full: every expiry and strike of each ticker (see iter_option)
+        :param filters: optional ChainFilter (moneyness, volume, days to expiry)
+        :return: Portfolio with the options data, failures by ticker in its failures dict
+        """
+        failures = {}
+        ptf = Portfolio.concat(
+            Options.iter_option(
+                stock_price, max_workers, progress, cancel, failures, full, filters
+            )
+        )
+        ptf.failures = failures
+        return ptf
+
+    @staticmethod
+    def price_frame(data: pd.DataFrame, r=0.05, q=0.04) -> pd.DataFrame:
+        """
+        Price the options of a dataframe (whole portfolio, streamed chunk or position file)
+        :param data: dataframe with Strike, Spot, Volatility, Type and Maturity
+            (YYYY-MM-DD) or T (year fraction) columns
+        :param r: risk-free rate(s)
+        :param q: dividend yield(s)
+        :return: typed dataframe with the price, greeks and status columns filled
+        """
+        return Portfolio(data).price(r, q).data
 
     @staticmethod
-    def generate_excel(data: pd.DataFrame):
-        data.to_excel("BSM_portfolio.xlsx", sheet_name="Portfolio", index=False)
+    @timed("excel_export")
+    def generate_excel(data: pd.DataFrame, path: str = "BSM_portfolio.xlsx"):
+        """
+        Export the priced portfolio, the format follows the extension of path
+        (xlsx, csv, parquet, feather)
+        """
+        export(data, path)
+
+    @staticmethod
+    def export_sink(path: str = "BSM_portfolio.xlsx") -> Sink:
+        """
+        :param path: output file (xlsx, csv, parquet, feather)
+        :return: sink to fill chunk by chunk with append()
+        """
+        return sink_for(path)
+
+
+class ChainFilter:
+    """
+    Selection applied while the chains are downloaded: expiries beyond max_dte are
+    never requested, rejected strikes are dropped before any frame is built
+    Attributes
+    ==========
+    min_moneyness: lowest strike / spot kept
+    max_moneyness: highest strike / spot kept
+    min_volume: lowest traded volume kept (missing volume counts as 0)
+    max_dte: furthest expiry kept, in days to expiry
+
+    """
+
+    def __init__(
+        self,
+        min_moneyness: float = None,
+        max_moneyness: float = None,
+        min_volume: float = None,
+        max_dte: int = None,
+    ):
+        self.min_moneyness = min_moneyness
+        self.max_moneyness = max_moneyness
+        self.min_volume = min_volume
+        self.max_dte = max_dte
+
+    def expiries(self, maturity: list, today: date = None) -> list:
+        """
+        :param maturity: expiries in YYYY-MM-DD format
+        :return: the expiries within max_dte
+        """
+        if self.max_dte is None:
+            return list(maturity)
+        today = date.today() if today is None else today
+        return [
+            e for e in maturity if (date.fromisoformat(e) - today).days <= self.max_dte
+        ]
+
+    def mask(self, chain: pd.DataFrame, spot: float) -> np.ndarray:
+        """
+        :param chain: calls or puts of one expiry as returned by the provider
+        :return: boolean mask of the rows kept
+        """
+        keep = np.ones(len(chain), dtype=bool)
+        if self.min_moneyness is not None or self.max_moneyness is not None:
+            moneyness = chain["strike"].to_numpy(dtype=float) / spot
+            if self.min_moneyness is not None:
+                keep &= moneyness >= self.min_moneyness
+            if self.max_moneyness is not None:
+                keep &= moneyness <= self.max_moneyness
+        if self.min_volume is not None:
+            volume = np.nan_to_num(chain["volume"].to_numpy(dtype=float))
+            keep &= volume >= self.min_volume
+        return keep
+
+
+class Portfolio:
+    """
+    Typed columnar book of options shared by the fetch, pricing and export stages:
+    categorical tickers, types and currencies, datetime64 expiries with their year
+    fraction, float64 inputs and preallocated float64 outputs
+    Attributes
+    ==========
+    data: dataframe holding the typed columns (Quantity and Multiplier default to 1)
+    failures: tickers whose chain could not be retrieved, with their error
+
+    """
+
+    INPUTS = {
+        "Ticker": "category",
+        "Spot": "float64",
+        "Maturity": "datetime64[ns]",
+        "T": "float64",
+        "Type": "category",
+        "Contract Symbol": "object",
+        "Strike": "float64",
+        "Volatility": "float64",
+        "Market Price": "float64",
+        "Volume": "float64",
+        "Currency": "category",
+        "Quantity": "float64",
+        "Multiplier": "float64",
+    }
+    OUTPUTS = ["Price", "Delta", "Gamma", "Vega", "Theta", "Rho"]
+    # position of one contract by default
+    DEFAULTS = {"Quantity": 1.0, "Multiplier": 1.0}
+
+    def __init__(self, data: pd.DataFrame = None):
+        data = pd.DataFrame() if data is None else data
+        if not data.index.equals(pd.RangeIndex(len(data))):
+            # the columns are aligned on the positional index of the book
+            data = data.reset_index(drop=True)
+        columns = {}
+        expiries = None
+        for col, dtype in self.INPUTS.items():
+            if col == "T" and "T" not in data and "Maturity" in data:
+                expiries = year_fraction(data["Maturity"], return_inverse=True)
+                columns[col] = expiries[0][expiries[1]]
+            elif col in data:
+                columns[col] = data[col].astype(dtype, copy=False)
+            elif col in self.DEFAULTS:
+                columns[col] = np.full(len(data), self.DEFAULTS[col], dtype=dtype)
+            elif data.empty:
+                columns[col] = pd.Series([], dtype=dtype)
+        for col in data.columns:
+            if col not in columns and col not in self.OUTPUTS + ["Status"]:
+                columns[col] = data[col]
+
+        # outputs allocated once with their final dtype, filled in place by price()
+        for col in self.OUTPUTS:
+            columns[col] = np.full(len(data), np.nan)
+        columns["Status"] = pd.Categorical.from_codes(
+            np.full(len(data), -1), dtype=STATUS
+        )
+
+        self.data = pd.DataFrame(columns, index=pd.RangeIndex(len(data)))
+        self.failures = {}
+
+        # private
+        self._expiries = None
+        if expiries is not None:
+            # the expiry index of year_fraction is reused by price()
+            self._expiries = (_root(self.data["T"].to_numpy()),) + expiries
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @classmethod
+    def concat(cls, portfolios) -> "Portfolio":
+        """
+        :param portfolios: iterable of Portfolio (e.g. the chunks of iter_option)
+        :return: one Portfolio, categorical columns stay categorical
+        """
+        frames = [p.data for p in portfolios]
+        if not frames:
+            return cls()
+        categorical = [c for c, d in frames[0].dtypes.items() if d == "category"]
+        for col in categorical:
+            union = union_categoricals([f[col] for f in frames]).categories
+            frames = [
+                f.assign(**{col: f[col].cat.set_categories(union)}) for f in frames
+            ]
+        ptf = cls.__new__(cls)
+        ptf.data = pd.concat(frames, ignore_index=True)
+        ptf.failures = {}
+        ptf._expiries = None
+        return ptf
+
+    @property
+    def expiries(self) -> tuple:
+        """
+        Distinct times to expiry, found once and kept while the T column is unchanged
+        :return: (times to expiry, position of each contract in them)
+        """
+        t = self.data["T"].to_numpy(dtype=float)
+        if self._expiries is None or self._expiries[0] is not _root(t):
+            t_expiry, inverse = np.unique(t, return_inverse=True)
+            self._expiries = (_root(t), t_expiry, inverse.ravel())
+        return self._expiries[1:]
+
+    @timed("pricing", items=len)
+    def price(self, r=0.05, q=0.04) -> "Portfolio":
+        """
+        Fill the price, greeks and status columns with the fused BSM kernel
+        :param r: risk-free rate(s) or Curve
+        :param q: dividend yield(s) or Curve
+        :return: the portfolio itself
+        """
+        strike = self.data["Strike"].to_numpy(dtype=float)
+        spot = self.data["Spot"].to_numpy(dtype=float)
+        t = self.data["T"].to_numpy(dtype=float)
+        is_call, is_put = _option_flags(self.data["Type"])
+        r, disc_r = discounting(r, self.expiries)
+        q, disc_q = discounting(q, self.expiries)
+        greeks = _greeks(
+            strike,
+            spot,
+            t,
+            self.data["Volatility"].to_numpy(dtype=float),
+            r,
+            q,
+            is_call,
+            is_put,
+            disc_r=disc_r,
+            disc_q=disc_q,
+        )
+        for col in self.OUTPUTS:
+            # written into the preallocated column
+            self.data.loc[:, col] = greeks[col.lower()]
+        self.data["Status"] = _status(strike, spot, is_call, is_put)
+        return self
+
+    def memory_usage(self) -> int:
+        """
+        :return: size of the book in bytes
+        """
+        return int(self.data.memory_usage(deep=True).sum())
+
+
+def discounting(r, expiries: tuple) -> tuple:
+    """
+    Rates and discount factors of a whole book, evaluated once per distinct expiry
+    and broadcast to the contracts
+    :param r: rate, Curve or one rate per contract
+    :param expiries: (times to expiry, position of each contract) as Portfolio.expiries
+    :return: (rate, discount factor) of every contract
+    """
+    t_expiry, inverse = expiries
+    if not isinstance(r, Curve):
+        if np.ndim(r):
+            # rates given by contract, only the expiries are shared
+            r = np.broadcast_to(np.asarray(r, dtype=float), inverse.shape)
+            return r, np.exp(-r * t_expiry[inverse])
+        r = Curve.flat(r)
+    return r.rate(t_expiry)[inverse], r.discount(t_expiry)[inverse]
+
+
+def _root(values: np.ndarray) -> np.ndarray:
+    """
+    :return: array owning the memory of values, identifies a dataframe column block
+    """
+    while isinstance(values.base, np.ndarray):
+        values = values.base
+    return values
+
+
+def year_fraction(
+    maturity, now: datetime = None, return_inverse: bool = False
+) -> np.ndarray:
+    """
+    Time to maturity in years (whole days / 365), computed once per distinct expiry
+    :param maturity: expiries (YYYY-MM-DD strings or datetimes)
+    :param now: valuation time, current time by default
+    :param return_inverse: return the expiry index instead of the broadcast values
+    :return: year fractions broadcast to every contract, or (year fraction of each
+        distinct expiry, position of each contract in them)
+    """
+    now = datetime.now() if now is None else now
+    expiry, inverse = np.unique(np.asarray(maturity), return_inverse=True)
+    days = (pd.to_datetime(expiry) - pd.Timestamp(now)) // pd.Timedelta(days=1)
+    t = np.asarray(days, dtype=float) / 365
+    if return_inverse:
+        return t, inverse.ravel()
+    return t[inverse.ravel()]
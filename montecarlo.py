@@ -0,0 +1,148 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.special import ndtri
+from scipy.stats import qmc
+
+from instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
+
+def european_payoff(paths: np.ndarray, strike: float, is_call: bool) -> np.ndarray:
+    """
+    :param paths: simulated log-prices, shape (paths, steps), last column at maturity
+    :return: payoff of each path
+    """
+    terminal = np.exp(paths[:, -1])
+    return np.maximum(terminal - strike if is_call else strike - terminal, 0)
+
+
+def _normals(method: str, seed: np.random.SeedSequence, n: int, steps: int):
+    """
+    :return: standard normals of shape (n, steps)
+    """
+    if method == "sobol":
+        sampler = qmc.Sobol(d=steps, scramble=True, seed=np.random.default_rng(seed))
+        # n is a power of two (see MonteCarlo), which keeps the balance properties
+        # of the sequence
+        u = sampler.random_base2(int(n).bit_length() - 1)
+        return ndtri(np.clip(u, 1e-12, 1 - 1e-12))
+    rng = np.random.default_rng(seed)
+    if method == "antithetic":
+        z = rng.standard_normal((n // 2, steps))
+        return np.concatenate([z, -z])
+    return rng.standard_normal((n, steps))
+
+
+def _simulate_chunk(
+    seed, n, strike, spot, t, sigma, r, q, is_call, steps, method, payoff
+) -> tuple:
+    """
+    Simulate one fixed-size chunk of GBM paths with dividend yield
+    :return: (sum, sum of squares, number of samples) of the discounted payoffs
+    """
+    dt = t / steps
+    z = _normals(method, seed, n, steps)
+    increments = (r - q - 0.5 * sigma**2) * dt + sigma * np.sqrt(dt) * z
+    paths = np.log(spot) + np.cumsum(increments, axis=1)
+    values = np.exp(-r * t) * payoff(paths, strike, is_call)
+
+    if method == "antithetic":
+        # a sample is the average of a path and its mirror, they are not independent
+        half = len(values) // 2
+        values = 0.5 * (values[:half] + values[half:])
+    return values.sum(), (values**2).sum(), len(values)
+
+
+class MonteCarlo:
+    """
+    Monte Carlo pricer under the BSM assumptions (GBM with continuous dividend yield).
+    Paths are generated in fixed-size chunks so that the memory stays flat whatever
+    the number of paths, each chunk has its own seed spawned from the master seed
+    (same seed, same price, whatever the number of workers)
+    Attributes
+    ==========
+    n_paths: number of simulated paths, the last chunk is cut to the remainder
+        except with sobol where whole chunks are simulated (n_paths rounded up)
+    chunk_size: number of paths by chunk, rounded up to a power of two with sobol
+    steps: number of time steps by path (1 is enough for european payoffs)
+    method: "antithetic", "sobol" (scrambled quasi-random) or "plain"
+    workers: number of processes, chunks run in the current process when 1
+    seed: master seed
+
+    """
+
+    def __init__(
+        self,
+        n_paths: int = 1_000_000,
+        chunk_size: int = 100_000,
+        steps: int = 1,
+        method: str = "antithetic",
+        workers: int = 1,
+        seed: int = 0,
+    ):
+        if method not in ("antithetic", "sobol", "plain"):
+            raise ValueError(f"unknown method {method}")
+        self.n_paths = n_paths
+        if method == "sobol":
+            chunk_size = 2 ** int(np.ceil(np.log2(max(chunk_size, 2))))
+        self.chunk_size = chunk_size - chunk_size % 2
+        self.steps = steps
+        self.method = method
+        self.workers = workers
+        self.seed = seed
+
+    @timed("monte_carlo", items=lambda result: result[2])
+    def price(
+        self,
+        strike: float,
+        spot: float,
+        t: float,
+        sigma: float,
+        option_type: str,
+        r: float = 0.05,
+        q: float = 0.04,
+        payoff=european_payoff,
+    ) -> tuple:
+        """
+        :param option_type: whether it is a Call or a Put
+        :param payoff: payoff(log-paths, strike, is_call), module level function so
+            that it can be sent to the worker processes
+        :return: (price, standard error, number of paths)
+        """
+        is_call = option_type.upper() == "CALL"
+        n_chunks = max(int(np.ceil(self.n_paths / self.chunk_size)), 1)
+        sizes = np.full(n_chunks, self.chunk_size)
+        if self.method != "sobol":
+            # last chunk cut to the remainder (even, paths go by pairs in antithetic)
+            last = self.n_paths - (n_chunks - 1) * self.chunk_size
+            sizes[-1] = max(last + last % 2, 2)
+        seeds = np.random.SeedSequence(self.seed).spawn(n_chunks)
+        args = [
+            (s, int(size), strike, spot, t, sigma, r, q, is_call)
+            + (self.steps, self.method, payoff)
+            for s, size in zip(seeds, sizes)
+        ]
+
+        if self.workers > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(_simulate_chunk, *zip(*args)))
+        else:
+            results = [_simulate_chunk(*a) for a in args]
+
+        sums, squares, counts = (np.array(x, dtype=float) for x in zip(*results))
+        n = counts.sum()
+        price = sums.sum() / n
+        if self.method == "sobol":
+            # randomized QMC: the independent scrambles give the error estimate
+            means = sums / counts
+            stderr = (
+                means.std(ddof=1) / np.sqrt(len(means)) if len(means) > 1 else np.nan
+            )
+        else:
+            variance = (squares.sum() - n * price**2) / (n - 1)
+            stderr = np.sqrt(variance / n)
+        paths = int(n * 2 if self.method == "antithetic" else n)
+        return price, stderr, paths
@@ -0,0 +1,223 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+from models import Portfolio, _greeks, _option_flags, _status, discounting
+
+logger = logging.getLogger(__name__)
+
+# rows of the shared matrix: inputs, then outputs (one contract per column)
+INPUTS = [
+    "strike",
+    "spot",
+    "t",
+    "sigma",
+    "r",
+    "q",
+    "disc_r",
+    "disc_q",
+    "is_call",
+    "is_put",
+]
+OUTPUTS = [col.lower() for col in Portfolio.OUTPUTS]
+_ROWS = INPUTS + OUTPUTS
+
+# shared blocks attached by a worker process, kept open between tasks
+_attached = {}
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """
+    Worker side: open the shared block once, the parent owns (and unlinks) it
+    """
+    for other in [n for n in _attached if n != name]:
+        _attached.pop(other).close()
+    if name not in _attached:
+        # only the creator tracks the block, else it would be unlinked twice
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:  # python < 3.13 always registers the attached blocks
+            register = resource_tracker.register
+            resource_tracker.register = lambda *args: None
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+        _attached[name] = shm
+    return _attached[name]
+
+
+def _price_shard(name: str, n: int, start: int, stop: int, rounding: bool) -> int:
+    """
+    Price the contracts start to stop of the shared book in place
+    :return: number of contracts priced
+    """
+    shm = _attach(name)
+    book = np.ndarray((len(_ROWS), n), dtype=np.float64, buffer=shm.buf)
+    rows = slice(start, stop)
+    x = {key: book[i, rows] for i, key in enumerate(INPUTS)}
+    greeks = _greeks(
+        x["strike"],
+        x["spot"],
+        x["t"],
+        x["sigma"],
+        x["r"],
+        x["q"],
+        x["is_call"] != 0,
+        x["is_put"] != 0,
+        rounding=rounding,
+        disc_r=x["disc_r"],
+        disc_q=x["disc_q"],
+    )
+    for key in OUTPUTS:
+        book[_ROWS.index(key), rows] = greeks[key]
+    return stop - start
+
+
+class ParallelPricer:
+    """
+    Multi-process pricing of large books. The inputs are copied once into a shared
+    memory block that the workers of a persistent process pool map without copy,
+    each worker prices a row range (shard) and writes its outputs into the same block
+    Attributes
+    ==========
+    workers: number of processes
+    shard_size: contracts by task, about 4 shards by worker when None
+
+    """
+
+    def __init__(self, workers: int = None, shard_size: int = None):
+        self.workers = workers or os.cpu_count()
+        self.shard_size = shard_size
+
+        # private
+        self._executor = None
+        self._shm = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _block(self, n: int) -> np.ndarray:
+        """
+        Shared matrix for n contracts, the block is reused while it is large enough
+        """
+        size = len(_ROWS) * n * 8
+        if self._shm is None or self._shm.size < size:
+            self._release()
+            self._shm = shared_memory.SharedMemory(create=True, size=max(size, 8))
+        return np.ndarray((len(_ROWS), n), dtype=np.float64, buffer=self._shm.buf)
+
+    def _release(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def _shards(self, n: int) -> list:
+        size = self.shard_size or max(-(-n // (4 * self.workers)), 10_000)
+        return [(start, min(start + size, n)) for start in range(0, n, size)]
+
+    @timed("parallel_pricing", items=len)
+    def price(self, portfolio, r=0.05, q=0.04, rounding: bool = True) -> Portfolio:
+        """
+        Fill the price, greeks and status columns like Portfolio.price
+        :param portfolio: Portfolio (or dataframe with its columns)
+        :param r: risk-free rate(s) or Curve
+        :param q: dividend yield(s) or Curve
+        :return: the portfolio
+        """
+        if not isinstance(portfolio, Portfolio):
+            portfolio = Portfolio(portfolio)
+        data = portfolio.data
+        n = len(data)
+        if not n:
+            return portfolio.price(r, q)
+
+        book = self._block(n)
+        is_call, is_put = _option_flags(data["Type"])
+        r, disc_r = discounting(r, portfolio.expiries)
+        q, disc_q = discounting(q, portfolio.expiries)
+        for key, values in [
+            ("strike", data["Strike"]),
+            ("spot", data["Spot"]),
+            ("t", data["T"]),
+            ("sigma", data["Volatility"]),
+            ("r", r),
+            ("q", q),
+            ("disc_r", disc_r),
+            ("disc_q", disc_q),
+            ("is_call", is_call),
+            ("is_put", is_put),
+        ]:
+            book[_ROWS.index(key)] = np.asarray(values, dtype=float)
+
+        futures = [
+            self._pool().submit(_price_shard, self._shm.name, n, start, stop, rounding)
+            for start, stop in self._shards(n)
+        ]
+        wait(futures)
+        for future in futures:
+            future.result()  # raise the error of a failed shard
+
+        for col in Portfolio.OUTPUTS:
+            data.loc[:, col] = book[_ROWS.index(col.lower())]
+        data["Status"] = _status(
+            book[_ROWS.index("strike")], book[_ROWS.index("spot")], is_call, is_put
+        )
+        return portfolio
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def scaling_report(book, cores=None, repeat: int = 3) -> pd.DataFrame:
+    """
+    Throughput of the parallel pricer by number of processes
+    :param book: Portfolio (or dataframe) to price
+    :param cores: process counts to measure, powers of 2 up to cpu_count by default
+    :param repeat: best of repeat runs, after one warm-up run that starts the pool
+    :return: dataframe with the duration, throughput, speedup and efficiency (speedup
+        / cores, 1 worker as reference) by core count
+    """
+    if not isinstance(book, Portfolio):
+        book = Portfolio(book)
+    if cores is None:
+        top = os.cpu_count() or 1
+        cores = sorted({2**i for i in range(top.bit_length()) if 2**i <= top} | {top})
+
+    rows = []
+    for c in cores:
+        with ParallelPricer(workers=c) as pricer:
+            pricer.price(book)
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                pricer.price(book)
+                best = min(best, time.perf_counter() - start)
+        rows.append(
+            {"cores": c, "seconds": best, "contracts_per_sec": len(book) / best}
+        )
+
+    report = pd.DataFrame(rows).set_index("cores")
+    reference = report["seconds"].iloc[0] * report.index[0]
+    report["speedup"] = reference / report["seconds"]
+    report["efficiency"] = report["speedup"] / report.index
+    logger.info(f"scaling on {len(book)} contracts:\n{report}")
+    return report
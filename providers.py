@@ -0,0 +1,337 @@
+import logging
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from datetime import date, timedelta
+
+import bs4 as bs
+import numpy as np
+import pandas as pd
+import requests
+import yfinance as yf
+
+from cache import DataCache
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter spacing the requests at no more than `rate` per second
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class TimeoutSession(requests.Session):
+    """
+    Http session with a connection pool and a default timeout on every request
+    """
+
+    def __init__(self, timeout: float = 10, pool_size: int = 10):
+        super().__init__()
+        self.timeout = timeout
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size
+        )
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+class MarketDataProvider(ABC):
+    """
+    Source of the market data used by the Options model
+    """
+
+    @abstractmethod
+    def constituents(self) -> list:
+        """
+        :return: list of the S&P 100 stock tickers
+        """
+
+    @abstractmethod
+    def spots(self, tickers: list) -> dict:
+        """
+        :param tickers: list of stock ticker
+        :return: dict with the last price of each ticker found
+        """
+
+    @abstractmethod
+    def expiries(self, ticker: str) -> list:
+        """
+        :param ticker: stock ticker
+        :return: listed expiries in YYYY-MM-DD format
+        """
+
+    @abstractmethod
+    def chain(self, ticker: str, expiry: str) -> dict:
+        """
+        :param ticker: stock ticker
+        :param expiry: expiry in YYYY-MM-DD format
+        :return: dict with the calls and puts dataframes (yahoo finance columns)
+        """
+
+    def is_cached(self, ticker: str, expiry: str) -> bool:
+        return False
+
+
+class YahooProvider(MarketDataProvider):
+    """
+    Wikipedia for the constituents, yahoo finance for the spots and the chains
+    Attributes
+    ==========
+    link: wikipedia page of the S&P 100
+    timeout: timeout of each http request (in seconds)
+    pool_size: size of the http connection pool
+    rate: maximum number of requests per second
+    max_retries: number of bulk spot downloads for the tickers still missing
+
+    """
+
+    def __init__(
+        self,
+        link: str = "https://en.wikipedia.org/wiki/S%26P_100#Components",
+        timeout: float = 10,
+        pool_size: int = 8,
+        rate: float = 5,
+        max_retries: int = 3,
+    ):
+        self.link = link
+        self.max_retries = max_retries
+        self.session = TimeoutSession(timeout=timeout, pool_size=pool_size)
+        self.limiter = RateLimiter(rate)
+
+        # private
+        self._tickers = {}
+        self._lock = threading.Lock()
+
+    def _ticker(self, ticker: str) -> yf.Ticker:
+        """
+        One Ticker per symbol, reused for its expiries and chains
+        """
+        with self._lock:
+            if ticker not in self._tickers:
+                self._tickers[ticker] = yf.Ticker(str(ticker), session=self.session)
+            return self._tickers[ticker]
+
+    def constituents(self) -> list:
+        self.limiter.wait()
+        r = self.session.get(self.link)
+        soup = bs.BeautifulSoup(r.text, "lxml")
+        table = soup.find("table", {"class": "wikitable", "id": "constituents"})
+        tickers = []
+
+        for i in table.findAll("tr")[1:]:
+            for x in i.findAll("td"):
+                ticker = x.get_text()
+                tickers.append(ticker)
+                break
+
+        return [i.replace("\n", "") for i in tickers]
+
+    def spots(self, tickers: list) -> dict:
+        """
+        Bulk download of the last prices: intraday bars of the day first, then the
+        daily closes of the last days for the tickers still missing (bounded retries)
+        """
+        found = {}
+        missing = list(tickers)
+        windows = [("1d", "1m")] + [("5d", "1d")] * max(self.max_retries - 1, 0)
+
+        for attempt, (period, interval) in enumerate(windows):
+            if not missing:
+                break
+            if attempt:
+                logger.info(f"{len(missing)} missing spots, retry {attempt}")
+            self.limiter.wait()
+            data = yf.download(
+                missing,
+                period=period,
+                interval=interval,
+                progress=False,
+                session=self.session,
+            )["Adj Close"]
+            if isinstance(data, pd.Series):
+                data = data.to_frame(missing[0])
+            last = data.ffill().iloc[-1].dropna() if len(data) else pd.Series()
+            found.update(last.to_dict())
+            missing = [t for t in missing if t not in found]
+
+        if missing:
+            logger.warning(f"no spot found for {missing}")
+        return found
+
+    def expiries(self, ticker: str) -> list:
+        self.limiter.wait()
+        return list(self._ticker(ticker).options)
+
+    def chain(self, ticker: str, expiry: str) -> dict:
+        # a single request returns both the calls and the puts
+        self.limiter.wait()
+        chain = self._ticker(ticker).option_chain(expiry)
+        return {"calls": chain.calls, "puts": chain.puts}
+
+
+class OfflineProvider(MarketDataProvider):
+    """
+    Local stand-in without network: serves the snapshots of a cache file when given,
+    otherwise deterministic synthetic data (same seed, same market)
+    Attributes
+    ==========
+    n_tickers: number of synthetic stocks
+    n_expiries: number of monthly expiries by stock
+    n_strikes: number of strikes by expiry
+    seed: seed of the synthetic market
+    cache: DataCache whose snapshots are replayed whatever their age
+
+    """
+
+    def __init__(
+        self,
+        n_tickers: int = 100,
+        n_expiries: int = 8,
+        n_strikes: int = 40,
+        seed: int = 0,
+        cache: DataCache = None,
+    ):
+        self.n_tickers = n_tickers
+        self.n_expiries = n_expiries
+        self.n_strikes = n_strikes
+        self.seed = seed
+        self.cache = cache
+        if cache is not None:
+            cache.offline = True
+
+    def _rng(self, *key) -> np.random.Generator:
+        """
+        Random generator depending only on the seed and the key (ticker, expiry...)
+        """
+        return np.random.default_rng([self.seed, zlib.crc32("/".join(key).encode())])
+
+    def _cached(self, kind: str, key: str):
+        return None if self.cache is None else self.cache.get(kind, key)
+
+    def constituents(self) -> list:
+        tickers = self._cached("constituents", "sp100")
+        if tickers is None:
+            tickers = [f"SYN{i:03d}" for i in range(self.n_tickers)]
+        return tickers
+
+    def spots(self, tickers: list) -> dict:
+        found = {}
+        for t in tickers:
+            spot = self._cached("spots", t)
+            if spot is None:
+                spot = round(float(self._rng(t).uniform(20, 500)), 2)
+            found[t] = spot
+        return found
+
+    def expiries(self, ticker: str) -> list:
+        maturity = self._cached("expiries", ticker)
+        if maturity is None:
+            today = date.today()
+            maturity = [
+                (today + timedelta(days=30 * (i + 1))).strftime("%Y-%m-%d")
+                for i in range(self.n_expiries)
+            ]
+        return maturity
+
+    def chain(self, ticker: str, expiry: str) -> dict:
+        chain = self._cached("chains", f"{ticker}/{expiry}")
+        if chain is not None:
+            return chain
+
+        from models import Options
+
+        rng = self._rng(ticker, expiry)
+        spot = self.spots([ticker])[ticker]
+        t = max((date.fromisoformat(expiry) - date.today()).days, 1) / 365
+        strike = np.round(spot * np.linspace(0.6, 1.4, self.n_strikes), 1)
+        moneyness = np.log(strike / spot)
+        base_vol = rng.uniform(0.15, 0.45)
+
+        chain = {}
+        for option_type in ["calls", "puts"]:
+            # smile: convex in log-moneyness, steeper for short maturities
+            vol = base_vol - 0.1 * moneyness + 0.4 * moneyness**2 / np.sqrt(t)
+            price = Options.greeks_batch(strike, spot, t, vol, option_type[:-1])[
+                "price"
+            ]
+            code = "C" if option_type == "calls" else "P"
+            chain[option_type] = pd.DataFrame(
+                {
+                    "contractSymbol": [
+                        f"{ticker}{expiry.replace('-', '')[2:]}{code}{int(k * 1000):08d}"
+                        for k in strike
+                    ],
+                    "strike": strike,
+                    "lastPrice": price,
+                    "bid": np.round(price * 0.98, 2),
+                    "ask": np.round(price * 1.02, 2),
+                    "volume": rng.integers(0, 5000, self.n_strikes).astype(float),
+                    "openInterest": rng.integers(0, 20000, self.n_strikes),
+                    "impliedVolatility": vol,
+                    "currency": "USD",
+                }
+            )
+        return chain
+
+
+class CachedProvider(MarketDataProvider):
+    """
+    Serve the data of another provider through a DataCache, only the missing or
+    expired entries reach the underlying provider
+    """
+
+    def __init__(self, provider: MarketDataProvider, cache: DataCache = None):
+        self.provider = provider
+        self.cache = DataCache() if cache is None else cache
+
+    def constituents(self) -> list:
+        tickers = self.cache.get("constituents", "sp100")
+        if tickers is None:
+            tickers = self.provider.constituents()
+            self.cache.set("constituents", "sp100", tickers)
+        return tickers
+
+    def spots(self, tickers: list) -> dict:
+        found = self.cache.get_many("spots", tickers)
+        missing = [t for t in tickers if t not in found]
+        if missing:
+            downloaded = self.provider.spots(missing)
+            self.cache.set_many("spots", downloaded)
+            found.update(downloaded)
+        return found
+
+    def expiries(self, ticker: str) -> list:
+        maturity = self.cache.get("expiries", ticker)
+        if maturity is None:
+            maturity = self.provider.expiries(ticker)
+            self.cache.set("expiries", ticker, maturity)
+        return maturity
+
+    def chain(self, ticker: str, expiry: str) -> dict:
+        chain = self.cache.get("chains", f"{ticker}/{expiry}")
+        if chain is None:
+            chain = self.provider.chain(ticker, expiry)
+            self.cache.set("chains", f"{ticker}/{expiry}", chain)
+        return chain
+
+    def is_cached(self, ticker: str, expiry: str) -> bool:
+        return self.cache.has("chains", f"{ticker}/{expiry}")
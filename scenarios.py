@@ -0,0 +1,189 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+from models import Portfolio, _option_flags, _price
+
+logger = logging.getLogger(__name__)
+
+# float64 temporaries held by the price-only kernel for each contract x scenario
+# cell (peak measured with tracemalloc)
+_CELL_BYTES = 8 * 12
+
+
+def scenario_grid(
+    spot_shocks=np.round(np.arange(-0.30, 0.31, 0.01), 2),
+    vol_shocks=(0.0,),
+    rate_shifts=(0.0,),
+    div_shifts=(0.0,),
+) -> pd.DataFrame:
+    """
+    Cartesian grid of market scenarios
+    :param spot_shocks: relative spot moves (-0.3 = -30%)
+    :param vol_shocks: absolute volatility moves (0.05 = +5 vol points)
+    :param rate_shifts: absolute risk-free rate shifts
+    :param div_shifts: absolute dividend yield shifts
+    :return: dataframe with one row per scenario
+    """
+    index = pd.MultiIndex.from_product(
+        [spot_shocks, vol_shocks, rate_shifts, div_shifts],
+        names=["Spot Shock", "Vol Shock", "Rate Shift", "Div Shift"],
+    )
+    return index.to_frame(index=False)
+
+
+def _revalue_chunk(
+    codes, strike, spot, t, sigma, weight, is_call, is_put, base, r, q, scenarios
+):
+    """
+    Revalue a chunk of contracts (sorted by ticker) under every scenario
+    :return: (ticker codes, P&L summed by ticker with shape (tickers, scenarios))
+    """
+    col = (slice(None), None)
+    price = _price(
+        strike[col],
+        spot[col] * (1 + scenarios["Spot Shock"]),
+        t[col],
+        np.maximum(sigma[col] + scenarios["Vol Shock"], 1e-6),
+        r + scenarios["Rate Shift"],
+        q + scenarios["Div Shift"],
+        is_call[col],
+        is_put[col],
+    )
+    # unpriced contracts (expired, unknown type...) do not contribute, else their NaN
+    # would wipe the sum of the whole ticker
+    pnl = np.nan_to_num((price - base[col]) * weight[col])
+
+    # contracts are sorted by ticker: one reduceat per ticker segment
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    return codes[starts], np.add.reduceat(pnl, starts, axis=0)
+
+
+class ScenarioEngine:
+    """
+    Full revaluation of a portfolio under a grid of market scenarios. The contract
+    arrays are broadcast against the scenario arrays and repriced in chunks sized to
+    a memory budget
+    Attributes
+    ==========
+    portfolio: Portfolio (or dataframe with its columns) to revalue
+    r: risk-free rate of the base scenario
+    q: dividend yield of the base scenario
+    memory_budget: bytes allowed for the temporaries of one chunk
+    workers: number of processes, chunks are priced in the current process when 1
+
+    """
+
+    def __init__(
+        self,
+        portfolio,
+        r: float = 0.05,
+        q: float = 0.04,
+        memory_budget: int = 256 * 1024**2,
+        workers: int = 1,
+    ):
+        if not isinstance(portfolio, Portfolio):
+            portfolio = Portfolio(portfolio)
+        data = portfolio.data
+        self.r = r
+        self.q = q
+        self.memory_budget = memory_budget
+        self.workers = workers
+
+        # contracts sorted by ticker once, so that each chunk reduces by segment
+        ticker = data["Ticker"].astype("category")
+        order = np.argsort(ticker.cat.codes.to_numpy(), kind="stable")
+        self.tickers = ticker.cat.categories
+        self.codes = ticker.cat.codes.to_numpy()[order]
+        self.strike = data["Strike"].to_numpy(dtype=float)[order]
+        self.spot = data["Spot"].to_numpy(dtype=float)[order]
+        self.t = data["T"].to_numpy(dtype=float)[order]
+        self.sigma = data["Volatility"].to_numpy(dtype=float)[order]
+        weight = np.ones(len(data))
+        for col in ["Quantity", "Multiplier"]:
+            if col in data:
+                weight = weight * data[col].to_numpy(dtype=float)
+        self.weight = weight[order]
+        is_call, is_put = _option_flags(data["Type"])
+        self.is_call = is_call[order]
+        self.is_put = is_put[order]
+        self.base = _price(
+            self.strike,
+            self.spot,
+            self.t,
+            self.sigma,
+            r,
+            q,
+            self.is_call,
+            self.is_put,
+        )
+        # contracts without a base price, left out of the P&L
+        self.excluded = int(np.count_nonzero(~np.isfinite(self.base)))
+
+    def chunk_size(self, n_scenarios: int) -> int:
+        """
+        :return: number of contracts by chunk fitting in the memory budget
+        """
+        return max(int(self.memory_budget // (n_scenarios * _CELL_BYTES)), 1)
+
+    def _chunks(self, scenarios: dict, size: int):
+        for start in range(0, len(self.codes), size):
+            rows = slice(start, start + size)
+            yield (
+                self.codes[rows],
+                self.strike[rows],
+                self.spot[rows],
+                self.t[rows],
+                self.sigma[rows],
+                self.weight[rows],
+                self.is_call[rows],
+                self.is_put[rows],
+                self.base[rows],
+                self.r,
+                self.q,
+                scenarios,
+            )
+
+    @timed("scenario_revaluation")
+    def run(self, scenarios: pd.DataFrame = None) -> dict:
+        """
+        :param scenarios: output of scenario_grid, the ±30% spot ladder by default
+        :return: dict with the P&L by ticker (dataframe tickers x scenarios), the
+            total P&L of the book (series by scenario) and the number of unpriced
+            contracts excluded
+        """
+        scenarios = scenario_grid() if scenarios is None else scenarios
+        arrays = {
+            col: scenarios[col].to_numpy(dtype=float)[None, :]
+            for col in ["Spot Shock", "Vol Shock", "Rate Shift", "Div Shift"]
+        }
+        pnl = np.zeros((len(self.tickers), len(scenarios)))
+        size = self.chunk_size(len(scenarios))
+        chunks = self._chunks(arrays, size)
+        logger.info(
+            f"{len(self.codes)} contracts x {len(scenarios)} scenarios, "
+            f"chunks of {size} contracts"
+        )
+        if self.excluded:
+            logger.warning(f"{self.excluded} unpriced contracts excluded from the P&L")
+
+        if self.workers > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                results = executor.map(_revalue_chunk, *zip(*chunks))
+                for codes, sums in results:
+                    np.add.at(pnl, codes, sums)
+        else:
+            for chunk in chunks:
+                codes, sums = _revalue_chunk(*chunk)
+                np.add.at(pnl, codes, sums)
+
+        columns = pd.MultiIndex.from_frame(scenarios)
+        by_ticker = pd.DataFrame(pnl, index=self.tickers, columns=columns)
+        return {
+            "ticker": by_ticker,
+            "total": by_ticker.sum(axis=0),
+            "excluded": self.excluded,
+        }
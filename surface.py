@@ -0,0 +1,241 @@
+import logging
+
+import numpy as np
+from scipy.optimize import least_squares
+
+from instrumentation import timed
+from models import Portfolio, _option_flags
+
+logger = logging.getLogger(__name__)
+
+
+def svi(k, a, b, rho, m, s):
+    """
+    Raw SVI total variance of a smile
+    :param k: log-moneyness
+    """
+    return a + b * (rho * (k - m) + np.sqrt((k - m) ** 2 + s * s))
+
+
+def _fit_svi(k: np.ndarray, w: np.ndarray) -> tuple:
+    """
+    Least squares fit of the raw SVI parameters on one expiry
+    :return: (a, b, rho, m, s)
+    """
+    start = [w.min() / 2, 0.1, 0.0, k[np.argmin(w)], 0.1]
+    lower = [-w.max(), 0.0, -0.999, 2 * k.min() - 1, 1e-3]
+    upper = [w.max(), 10.0, 0.999, 2 * k.max() + 1, 5.0]
+    fit = least_squares(
+        lambda p: svi(k, *p) - w, np.clip(start, lower, upper), bounds=(lower, upper)
+    )
+    return tuple(fit.x)
+
+
+class VolSurface:
+    """
+    Implied volatility surface of one underlying, indexed by log-moneyness
+    log(strike / spot) and time to expiry. Each expiry (smile) is interpolated in total
+    variance, linearly or through a SVI fit, and tabulated once on a uniform
+    log-moneyness grid; queries read the table and interpolate the total variance
+    linearly in time, vectorized over any number of strikes and maturities.
+    Constant total variance beyond the grid, constant volatility before the first
+    and after the last expiry
+    Attributes
+    ==========
+    spot: spot of the underlying the moneyness is measured against
+    method: "linear" or "svi" (linear when an expiry has less than 5 quotes)
+    k_range: log-moneyness covered by the lookup table
+    n_k: number of points of the lookup table by expiry
+
+    """
+
+    def __init__(
+        self,
+        spot: float,
+        method: str = "linear",
+        k_range: tuple = (-1.5, 1.5),
+        n_k: int = 301,
+    ):
+        if method not in ("linear", "svi"):
+            raise ValueError(f"unknown method {method}")
+        self.spot = spot
+        self.method = method
+        self.k_grid = np.linspace(k_range[0], k_range[1], n_k)
+        self.slices = {}  # expiry -> (T, log-moneyness, total variance, svi params)
+
+        # lookup table, one row by expiry sorted by time to expiry
+        self.times = np.array([])
+        self.table = np.empty((0, n_k))
+
+        # private
+        self._rows = {}
+
+    @classmethod
+    def from_chain(cls, data, ticker: str = None, **kwargs) -> "VolSurface":
+        """
+        :param data: Portfolio or dataframe of contracts (e.g. Options.get_option with
+            full=True)
+        :param ticker: underlying to keep, the data must hold a single one otherwise
+        :return: surface built at the spot of the contracts
+        """
+        data = data.data if isinstance(data, Portfolio) else data
+        if ticker is not None:
+            data = data[data["Ticker"] == ticker]
+        surface = cls(float(data["Spot"].iloc[0]), **kwargs)
+        return surface.update(data)
+
+    def _slice(self, k: np.ndarray, w: np.ndarray, t: float) -> tuple:
+        """
+        Clean and fit the quotes of one expiry
+        :return: (T, log-moneyness, total variance, svi params or None)
+        """
+        # several quotes on a strike (call and put) are averaged
+        k, inverse = np.unique(k, return_inverse=True)
+        w = np.bincount(inverse, weights=w) / np.bincount(inverse)
+        params = None
+        if self.method == "svi" and len(k) >= 5:
+            params = _fit_svi(k, w)
+        return t, k, w, params
+
+    def _row(self, expiry) -> np.ndarray:
+        t, k, w, params = self.slices[expiry]
+        if params is None:
+            return np.interp(self.k_grid, k, w)
+        inside = np.clip(self.k_grid, k.min(), k.max())
+        return np.maximum(svi(inside, *params), 0.0)
+
+    def _stack(self):
+        """
+        Lookup table from the rows of the expiries, sorted by time to expiry
+        """
+        order = sorted(self.slices, key=lambda e: self.slices[e][0])
+        self.times = np.array([self.slices[e][0] for e in order])
+        self.table = (
+            np.vstack([self._rows[e] for e in order])
+            if order
+            else np.empty((0, len(self.k_grid)))
+        )
+
+    @timed("surface_update")
+    def update(self, data, vol_column: str = "Volatility") -> "VolSurface":
+        """
+        Rebuild the smiles of the expiries present in data, the other expiries and
+        their lookup rows are kept as they are
+        :param data: contracts of the underlying with Strike, T (or Maturity),
+            Volatility and optionally Type and Maturity columns
+        :param vol_column: column holding the implied volatility
+        :return: the surface itself
+        """
+        data = data.data if isinstance(data, Portfolio) else Portfolio(data).data
+        strike = data["Strike"].to_numpy(dtype=float)
+        t = data["T"].to_numpy(dtype=float)
+        vol = data[vol_column].to_numpy(dtype=float)
+        k = np.log(strike / self.spot)
+        valid = (vol > 0) & (t > 0) & np.isfinite(k)
+
+        # out of the money quotes are the liquid side of the smile
+        is_call, is_put = _option_flags(data["Type"])
+        otm = (is_call & (k >= 0)) | (is_put & (k < 0))
+
+        expiries = data["Maturity"] if "Maturity" in data else data["T"]
+        for expiry, rows in expiries.groupby(expiries, observed=True).indices.items():
+            rows = rows[valid[rows]]
+            if np.count_nonzero(otm[rows]) >= 2:
+                rows = rows[otm[rows]]
+            if len(rows) < 2:
+                logger.debug(f"not enough quotes on {expiry}")
+                continue
+            te = float(np.median(t[rows]))
+            self.slices[expiry] = self._slice(k[rows], vol[rows] ** 2 * te, te)
+            self._rows[expiry] = self._row(expiry)
+
+        self._stack()
+        return self
+
+    def drop(self, expiries) -> "VolSurface":
+        """
+        Remove expiries (e.g. expired ones) from the surface
+        """
+        for expiry in expiries:
+            self.slices.pop(expiry, None)
+            self._rows.pop(expiry, None)
+        self._stack()
+        return self
+
+    def total_variance(self, k, t) -> np.ndarray:
+        """
+        :param k: log-moneyness(es)
+        :param t: time(s) to expiry in years
+        :return: total implied variance sigma^2 * t, broadcast over k and t
+        """
+        if not len(self.times):
+            raise ValueError("empty surface")
+        k, t = np.broadcast_arrays(np.asarray(k, float), np.asarray(t, float))
+        grid = self.k_grid
+
+        # uniform grid: the cell of each k is found without a search
+        pos = np.clip((k - grid[0]) / (grid[1] - grid[0]), 0, len(grid) - 1)
+        i = np.minimum(pos.astype(int), len(grid) - 2)
+        f = pos - i
+
+        def smile(j):
+            return self.table[j, i] * (1 - f) + self.table[j, i + 1] * f
+
+        times = self.times
+        last = len(times) - 1
+        j = np.clip(np.searchsorted(times, t), 1, max(last, 1))
+        if last == 0:
+            return smile(np.zeros_like(i)) * t / times[0]
+
+        t0, t1 = times[j - 1], times[j]
+        w0, w1 = smile(j - 1), smile(j)
+        w = w0 + (t - t0) / (t1 - t0) * (w1 - w0)
+        w = np.where(t < times[0], w0 * t / times[0], w)
+        return np.where(t > times[last], w1 * t / times[last], w)
+
+    def vol(self, strike, t, spot: float = None) -> np.ndarray:
+        """
+        :param strike: strike(s), any value (off the listed grid too)
+        :param t: time(s) to expiry in years
+        :param spot: moneyness measured against this spot (sticky moneyness), the spot
+            of the surface by default
+        :return: implied volatilities broadcast over strike and t
+        """
+        spot = self.spot if spot is None else spot
+        t = np.asarray(t, float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            w = self.total_variance(np.log(np.asarray(strike, float) / spot), t)
+            return np.sqrt(np.maximum(w, 0.0) / t)
+
+
+def build_surfaces(data, **kwargs) -> dict:
+    """
+    :param data: Portfolio or dataframe of contracts of several underlyings
+    :return: dict ticker -> VolSurface
+    """
+    data = data.data if isinstance(data, Portfolio) else data
+    surfaces = {}
+    for ticker, rows in data.groupby("Ticker", observed=True).indices.items():
+        try:
+            surfaces[ticker] = VolSurface.from_chain(data.iloc[rows], **kwargs)
+        except Exception as e:
+            logger.warning(f"volatility surface of {ticker} not built: {e}")
+    return surfaces
+
+
+def surface_vols(data, surfaces: dict) -> np.ndarray:
+    """
+    Volatility of each contract read on the surface of its underlying
+    :param data: Portfolio or dataframe with Ticker, Strike, Spot and T (or Maturity)
+    :param surfaces: dict ticker -> VolSurface (build_surfaces)
+    :return: array of volatilities, NaN for the tickers without surface
+    """
+    data = data.data if isinstance(data, Portfolio) else Portfolio(data).data
+    vols = np.full(len(data), np.nan)
+    strike = data["Strike"].to_numpy(dtype=float)
+    spot = data["Spot"].to_numpy(dtype=float)
+    t = data["T"].to_numpy(dtype=float)
+    for ticker, rows in data.groupby("Ticker", observed=True).indices.items():
+        if ticker in surfaces:
+            vols[rows] = surfaces[ticker].vol(strike[rows], t[rows], spot[rows])
+    return vols
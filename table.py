@@ -0,0 +1,214 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class TableModel:
+    """
+    Model side of the result viewer: holds the book and the current view (row
+    positions after filter and sort). Streamed chunks are kept as they arrive, the
+    unfiltered and unsorted view reads its rows straight from them. The chunks are
+    merged and indexed (rows by ticker and by expiry, moneyness sorted once) only
+    when a filter or a sort asks for it, each sort order is computed once by column
+    and reused for every filter, only the visible slice is ever formatted
+    Attributes
+    ==========
+    data: dataframe displayed (the chunks merged on access)
+    view: positions of the rows shown, in display order
+
+    """
+
+    def __init__(self, data: pd.DataFrame = None):
+        self.sort_key = None  # (column, ascending)
+        self.filters = {}
+
+        # private
+        self._frames = []  # chunks in arrival order
+        self._starts = [0]  # position of the first row of each chunk, then the total
+        self._data = None  # chunks merged, built on demand
+        self._index = None
+        self._orders = {}
+        self._view = None
+        if data is not None:
+            self.append(data)
+
+    def __len__(self) -> int:
+        if self._plain():
+            return self._starts[-1]
+        return len(self.view)
+
+    @property
+    def columns(self) -> list:
+        return list(self._frames[0].columns) if self._frames else []
+
+    @property
+    def data(self) -> pd.DataFrame:
+        if self._data is None:
+            if len(self._frames) > 1:
+                self._data = pd.concat(self._frames, ignore_index=True)
+                self._frames = [self._data]
+                self._starts = [0, len(self._data)]
+            else:
+                self._data = self._frames[0] if self._frames else pd.DataFrame()
+        return self._data
+
+    @property
+    def view(self) -> np.ndarray:
+        if self._view is None:
+            if self._plain():
+                self._view = np.arange(self._starts[-1])
+            else:
+                self._ensure()
+                self._apply()
+        return self._view
+
+    def _plain(self) -> bool:
+        return not self.filters and self.sort_key is None
+
+    def append(self, data: pd.DataFrame):
+        """
+        Add streamed rows, the indexes are rebuilt by the next filter or sort
+        """
+        if not len(data.columns):
+            return
+        self._frames.append(data.reset_index(drop=True))
+        self._starts.append(self._starts[-1] + len(data))
+        self._data = None
+        self._index = None
+        self._orders = {}
+        self._view = None
+
+    def _build(self):
+        """
+        Merge the chunks and index the book (ticker, expiry, moneyness)
+        """
+        data = self.data
+        index = {}
+        for col in ["Ticker", "Maturity"]:
+            if col in data:
+                index[col] = data.groupby(col, observed=True).indices
+        if {"Strike", "Spot"} <= set(data.columns):
+            moneyness = data["Strike"].to_numpy(dtype=float) / data["Spot"].to_numpy(
+                dtype=float
+            )
+            order = np.argsort(moneyness, kind="stable")
+            index["moneyness"] = (order, moneyness[order])
+        self._index = index
+
+    def _ensure(self):
+        if self._index is None:
+            self._build()
+
+    def values(self, column: str) -> list:
+        """
+        :return: distinct values of an indexed column (ticker, expiry) for the filters
+        """
+        self._ensure()
+        return sorted(self._index.get(column, {}))
+
+    def filter(self, **filters) -> int:
+        """
+        Restrict the view, None removes a filter
+        :param filters: Ticker=..., Maturity=..., moneyness=(low, high) on strike / spot
+        :return: number of rows in the view
+        """
+        self.filters.update(filters)
+        self.filters = {k: v for k, v in self.filters.items() if v is not None}
+        self._view = None
+        return len(self)
+
+    def sort(self, column: str, ascending: bool = True) -> int:
+        """
+        Order the view by a column, the filters are kept
+        :return: number of rows in the view
+        """
+        self.sort_key = (column, ascending)
+        self._view = None
+        return len(self)
+
+    def _order(self, column: str) -> np.ndarray:
+        """
+        :return: positions of the whole book sorted by column, computed once
+        """
+        if column not in self._orders:
+            values = self.data[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype(str)
+            self._orders[column] = np.argsort(values.to_numpy(), kind="stable")
+        return self._orders[column]
+
+    def _apply(self):
+        n = len(self.data)
+        keep = None
+        for col in ["Ticker", "Maturity"]:
+            if col in self.filters:
+                rows = self._index.get(col, {}).get(self.filters[col], [])
+                mask = np.zeros(n, dtype=bool)
+                mask[rows] = True
+                keep = mask if keep is None else keep & mask
+        if "moneyness" in self.filters and "moneyness" in self._index:
+            low, high = self.filters["moneyness"]
+            order, sorted_values = self._index["moneyness"]
+            lo = 0 if low is None else np.searchsorted(sorted_values, low, "left")
+            hi = n if high is None else np.searchsorted(sorted_values, high, "right")
+            mask = np.zeros(n, dtype=bool)
+            mask[order[lo:hi]] = True
+            keep = mask if keep is None else keep & mask
+
+        if self.sort_key is None:
+            view = np.arange(n) if keep is None else np.flatnonzero(keep)
+        else:
+            column, ascending = self.sort_key
+            order = self._order(column)
+            order = order if ascending else order[::-1]
+            view = order if keep is None else order[keep[order]]
+        self._view = view
+
+    def rows(self, start: int, stop: int) -> list:
+        """
+        :return: rows start to stop of the view, formatted for display
+        """
+        if self._plain():
+            pages = self._slice(start, min(stop, self._starts[-1]))
+        else:
+            pages = [self.data.iloc[self.view[start:stop]]]
+        return [
+            tuple(_cell(v) for v in row)
+            for page in pages
+            for row in page.itertuples(index=False, name=None)
+        ]
+
+    def _slice(self, start: int, stop: int) -> list:
+        """
+        :return: the pieces of the chunks holding the rows start to stop
+        """
+        pages = []
+        columns = self.columns
+        k = int(np.searchsorted(self._starts, start, side="right")) - 1
+        while start < stop and k < len(self._frames):
+            frame = self._frames[k]
+            lo, hi = start - self._starts[k], min(stop - self._starts[k], len(frame))
+            page = frame.iloc[lo:hi]
+            if list(frame.columns) != columns:
+                page = page.reindex(columns=columns)
+            pages.append(page)
+            start = self._starts[k] + hi
+            k += 1
+        return pages
+
+
+def _cell(value) -> str:
+    if (
+        value is None
+        or value is pd.NaT
+        or (isinstance(value, float) and value != value)
+    ):
+        return ""
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    if isinstance(value, pd.Timestamp):
+        return value.strftime("%Y-%m-%d")
+    return str(value)
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+from aggregation import MEASURES, Rollup
+from models import Portfolio
+
+
+def _priced(n=12) -> pd.DataFrame:
+    rng = np.random.default_rng(1)
+    data = pd.DataFrame(
+        {
+            "Ticker": rng.choice(["A", "B"], n),
+            "Maturity": pd.to_datetime("2030-01-01")
+            + pd.to_timedelta(rng.integers(0, 3, n) * 30, unit="D"),
+            "Spot": 100.0,
+            "T": rng.uniform(0.1, 1.0, n),
+            "Type": rng.choice(["Call", "Put"], n),
+            "Strike": rng.uniform(80, 120, n),
+            "Volatility": rng.uniform(0.1, 0.5, n),
+            "Quantity": rng.integers(-5, 5, n).astype(float),
+        }
+    )
+    return Portfolio(data).price().data
+
+
+def _assert_same(rollup, data):
+    full = Rollup(data)
+    for by in rollup.by:
+        pd.testing.assert_frame_equal(rollup.frame(by), full.frame(by))
+    pd.testing.assert_series_equal(rollup.totals(), full.totals())
+
+
+def test_reprice_unsorted_rows_matches_rebuild():
+    data = _priced()
+    rollup = Rollup(data)
+    rows = [5, 2, 9, 2]
+    new = {col: [1000.0, 1500.0, 3000.0, 2000.0] for col in MEASURES}
+    rollup.reprice(rows, new)
+
+    expected = data.copy()
+    for col in MEASURES:
+        # the last value of a duplicate row wins
+        expected.loc[[5, 2, 9], col] = [1000.0, 2000.0, 3000.0]
+    _assert_same(rollup, expected)
+
+
+def test_reprice_whole_book_arrays():
+    data = _priced()
+    rollup = Rollup(data)
+    new = {col: np.arange(len(data), dtype=float) for col in MEASURES}
+    rollup.reprice([7, 0, 7], new)
+
+    expected = data.copy()
+    for col in MEASURES:
+        expected.loc[[0, 7], col] = [0.0, 7.0]
+    _assert_same(rollup, expected)
+
+
+def test_set_quantity_matches_rebuild():
+    data = _priced()
+    rollup = Rollup(data)
+    rollup.set_quantity([3, 1, 3], [2.0, 0.0, 4.0])
+
+    expected = data.copy()
+    expected.loc[[1, 3], "Quantity"] = [0.0, 4.0]
+    _assert_same(rollup, expected)
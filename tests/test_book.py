@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from book import PricedBook
+from models import Portfolio
+
+
+def _book(n=30, tickers=("A", "B", "C")) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    spots = {"A": 100.0, "B": 50.0, "C": 20.0}
+    ticker = np.array(tickers)[rng.integers(0, len(tickers), n)]
+    spot = np.array([spots[t] for t in ticker])
+    return pd.DataFrame(
+        {
+            "Ticker": ticker,
+            "Spot": spot,
+            "T": rng.uniform(0.05, 2.0, n),
+            "Type": rng.choice(["Call", "Put"], n),
+            "Strike": spot * rng.uniform(0.7, 1.3, n),
+            "Volatility": rng.uniform(0.1, 0.6, n),
+        }
+    )
+
+
+def test_rows_cover_every_ticker():
+    data = _book()
+    book = PricedBook(data)
+    assert sorted(book.rows) == ["A", "B", "C"]
+    for ticker, rows in book.rows.items():
+        assert sorted(rows) == list(np.flatnonzero(data["Ticker"] == ticker))
+
+
+def test_update_spots_matches_full_pricing():
+    data = _book()
+    book = PricedBook(data)
+    spots = {"B": 55.0, "C": 21.0}
+    repriced = book.update_spots(spots)
+    assert repriced == data["Ticker"].isin(list(spots)).sum()
+
+    moved = data.copy()
+    moved["Spot"] = moved["Ticker"].map(spots).fillna(moved["Spot"])
+    expected = Portfolio(moved).price().data
+    result = book.data
+    for col in Portfolio.OUTPUTS + ["Spot"]:
+        np.testing.assert_allclose(result[col], expected[col])
+    assert (result["Status"] == expected["Status"]).all()
+
+
+def test_empty_book():
+    book = PricedBook(_book().iloc[:0])
+    assert book.rows == {}
+    assert book.update_spots({"A": 1.0}) == 0
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+from curves import Curve
+from models import Options, Portfolio, _greeks, _price
+
+
+def _prices(strike, spot, t, sigma, is_call):
+    n = len(strike)
+    return _greeks(
+        strike,
+        spot,
+        t,
+        sigma,
+        np.full(n, 0.05),
+        np.full(n, 0.04),
+        is_call,
+        ~is_call,
+        rounding=False,
+    )["price"]
+
+
+def test_implied_vol_above_initial_bound():
+    strike = np.array([100.0, 130.0, 100.0])
+    spot = np.full(3, 100.0)
+    t = np.array([0.02, 0.01, 0.5])
+    sigma = np.array([7.0, 12.0, 0.3])
+    is_call = np.array([True, True, False])
+    price = _prices(strike, spot, t, sigma, is_call)
+    types = np.where(is_call, "Call", "Put")
+
+    result = Options.implied_vol(price, strike, spot, t, types)
+    assert result["Converged"].all()
+    np.testing.assert_allclose(result["Implied Vol"], sigma, rtol=1e-6)
+
+    # not bracketed without widening: reported as unconverged, not as 500%
+    capped = Options.implied_vol(price, strike, spot, t, types, max_widen=0)
+    assert capped["Converged"].tolist() == [False, False, True]
+
+
+def test_price_only_kernel_matches_greeks():
+    rng = np.random.default_rng(0)
+    n = 200
+    strike = rng.uniform(50, 150, n)
+    spot = np.full(n, 100.0)
+    t = rng.uniform(0.01, 3.0, n)
+    sigma = rng.uniform(0.05, 1.0, n)
+    is_call = rng.random(n) < 0.5
+    expected = _prices(strike, spot, t, sigma, is_call)
+    result = _price(
+        strike, spot, t, sigma, np.full(n, 0.05), np.full(n, 0.04), is_call, ~is_call
+    )
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_implied_vol_not_converged_without_vega():
+    # deep in and out of the money: the price does not identify the volatility
+    strike = np.array([50.0, 200.0, 100.0])
+    spot = np.full(3, 100.0)
+    t = np.array([0.05, 0.05, 0.5])
+    sigma = np.array([0.15, 0.15, 0.25])
+    is_call = np.array([True, True, True])
+    price = _prices(strike, spot, t, sigma, is_call)
+
+    result = Options.implied_vol(price, strike, spot, t, "call")
+    assert result["Converged"].tolist() == [False, False, True]
+    assert abs(result["Implied Vol"].iloc[2] - 0.25) < 1e-6
+
+
+def test_curve_discounting_by_expiry():
+    data = pd.DataFrame(
+        {
+            "Ticker": "A",
+            "Spot": 100.0,
+            "Maturity": pd.Timestamp.now().normalize()
+            + pd.to_timedelta([30, 30, 200, 400], unit="D"),
+            "Type": ["call", "put", "call", "put"],
+            "Strike": [95.0, 105.0, 100.0, 110.0],
+            "Volatility": 0.2,
+        }
+    )
+    curve = Curve([0.25, 1.0], [0.03, 0.05])
+    ptf = Portfolio(data)
+    t = ptf.data["T"].to_numpy()
+    expected = Portfolio(data).price(curve.rate(t), 0.01).data["Price"]
+    pd.testing.assert_series_equal(ptf.price(curve, 0.01).data["Price"], expected)
+
+    # the expiry index follows a change of T
+    ptf.data["T"] = t + 0.5
+    moved = Portfolio(ptf.data.drop(columns="Maturity")).price(curve, 0.01)
+    pd.testing.assert_series_equal(
+        ptf.price(curve, 0.01).data["Price"], moved.data["Price"]
+    )
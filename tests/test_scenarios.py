@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+from scenarios import ScenarioEngine, scenario_grid
+
+
+def test_unpriced_contract_excluded_from_its_ticker_only():
+    data = pd.DataFrame(
+        {
+            "Ticker": ["A", "A", "B"],
+            "Spot": [100.0, 100.0, 50.0],
+            "T": [0.5, 0.0, 0.5],
+            "Type": ["call", "call", "put"],
+            "Strike": [100.0, 100.0, 50.0],
+            "Volatility": [0.2, 0.2, 0.3],
+        }
+    )
+    grid = scenario_grid(spot_shocks=(-0.1, 0.0, 0.1))
+    result = ScenarioEngine(data).run(grid)
+    alone = ScenarioEngine(data.drop(index=1)).run(grid)
+
+    assert result["excluded"] == 1
+    assert np.isfinite(result["ticker"].to_numpy()).all()
+    pd.testing.assert_frame_equal(result["ticker"], alone["ticker"])
+    pd.testing.assert_series_equal(result["total"], alone["total"])
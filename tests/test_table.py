@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from table import TableModel
+
+
+def _chunks(n_chunks=5, size=7):
+    rng = np.random.default_rng(0)
+    for i in range(n_chunks):
+        yield pd.DataFrame(
+            {
+                "Ticker": pd.Categorical([f"T{i}"] * size),
+                "Maturity": pd.to_datetime("2030-01-01")
+                + pd.to_timedelta(rng.integers(0, 3, size) * 30, unit="D"),
+                "Strike": rng.uniform(80, 120, size),
+                "Spot": 100.0,
+                "Price": rng.uniform(0, 10, size),
+            }
+        )
+
+
+def _streamed():
+    model = TableModel()
+    for chunk in _chunks():
+        model.append(chunk)
+    return model
+
+
+def test_streamed_rows_match_the_merged_book():
+    model = _streamed()
+    merged = TableModel(pd.concat(list(_chunks()), ignore_index=True))
+    assert len(model) == len(merged) == 35
+    for start, stop in [(0, 10), (5, 9), (6, 22), (30, 50), (40, 45)]:
+        assert model.rows(start, stop) == merged.rows(start, stop)
+
+
+def test_filter_and_sort_across_chunks():
+    model = _streamed()
+    data = pd.concat(list(_chunks()), ignore_index=True)
+
+    assert model.filter(Ticker="T3") == 7
+    assert [row[0] for row in model.rows(0, 10)] == ["T3"] * 7
+
+    model.filter(Ticker=None, moneyness=(0.9, 1.1))
+    model.sort("Price", ascending=False)
+    kept = data[(data["Strike"] / data["Spot"]).between(0.9, 1.1)]
+    expected = kept.sort_values("Price", ascending=False, kind="stable")
+    assert len(model) == len(expected)
+    np.testing.assert_array_equal(model.view, expected.index.to_numpy())
+
+    # a chunk streamed after the sort is indexed on the next query
+    model.append(next(_chunks(1)).assign(Strike=100.0, Price=99.0))
+    assert model.rows(0, 1)[0][-1] == "99"
+    assert model.values("Ticker") == [f"T{i}" for i in range(5)]
@@ -1,4 +1,5 @@
 import tkinter as tk
+from tkinter import filedialog
 from tkinter import messagebox
 from tkinter import ttk
 
@@ -6,7 +7,8 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from matplotlib.backends.backend_pdf import PdfPages
-from pandastable import Table
+
+from table import TableModel
 
 
 class Root(tk.Tk):
@@ -35,6 +37,142 @@ class Window(tk.Toplevel):
         self.iconbitmap("logo.ico")
 
 
+class VirtualTable(ttk.Frame):
+    """
+    Result viewer rendering only the visible rows: a fixed set of Treeview items is
+    refilled from the TableModel on every scroll, sort (click on a heading) and filter
+    """
+
+    def __init__(self, parent, model: TableModel, height: int = 30):
+        super().__init__(parent)
+        self.model = model
+        self.height = height
+        self.top = 0  # first row of the view on screen
+
+        # private
+        self._render_pending = False
+
+        # filters
+        bar = ttk.Frame(self)
+        bar.pack(fill="x")
+        ttk.Label(bar, text="Ticker:").pack(side="left", padx=2)
+        self.cmb_ticker = ttk.Combobox(
+            bar, width=10, state="readonly", postcommand=self._fill_choices
+        )
+        self.cmb_ticker.pack(side="left", padx=2)
+        ttk.Label(bar, text="Expiry:").pack(side="left", padx=2)
+        self.cmb_expiry = ttk.Combobox(
+            bar, width=12, state="readonly", postcommand=self._fill_choices
+        )
+        self.cmb_expiry.pack(side="left", padx=2)
+        ttk.Label(bar, text="Strike/Spot from").pack(side="left", padx=2)
+        self.ent_low = ttk.Entry(bar, width=6)
+        self.ent_low.pack(side="left")
+        ttk.Label(bar, text="to").pack(side="left", padx=2)
+        self.ent_high = ttk.Entry(bar, width=6)
+        self.ent_high.pack(side="left")
+        ttk.Button(bar, text="Filter", command=self.apply_filters).pack(
+            side="left", padx=5
+        )
+        self.lbl_rows = ttk.Label(bar, text="")
+        self.lbl_rows.pack(side="right", padx=5)
+
+        # table: as many items as visible lines, whatever the size of the book
+        body = ttk.Frame(self)
+        body.pack(fill="both", expand=True)
+        self.tree = ttk.Treeview(body, show="headings", height=height)
+        self.scroll = ttk.Scrollbar(body, orient="vertical", command=self._on_scroll)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scroll.pack(side="right", fill="y")
+        self.tree.bind("<MouseWheel>", self._on_wheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll_to(self.top - 3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll_to(self.top + 3))
+        self._items = []
+        self.refresh()
+
+    def _columns(self):
+        columns = self.model.columns
+        if list(self.tree["columns"]) == columns:
+            return
+        if self._items:
+            self.tree.delete(*self._items)
+        self.tree["columns"] = columns
+        for col in columns:
+            self.tree.heading(col, text=col, command=lambda c=col: self.sort(c))
+            self.tree.column(col, width=90, stretch=False)
+        self._items = [self.tree.insert("", "end") for _ in range(self.height)]
+
+    def refresh(self):
+        """
+        Refill the visible items from the model
+        """
+        self._render_pending = False
+        self._columns()
+        total = len(self.model)
+        self.top = max(min(self.top, total - self.height), 0)
+        rows = self.model.rows(self.top, self.top + self.height)
+        for i, item in enumerate(self._items):
+            self.tree.item(item, values=rows[i] if i < len(rows) else ())
+        if total:
+            self.scroll.set(self.top / total, (self.top + len(rows)) / total)
+        else:
+            self.scroll.set(0, 1)
+        self.lbl_rows.config(text=f"{total} rows")
+
+    def append(self, data: pd.DataFrame):
+        """
+        Streamed rows: the chunks received in the same Tk cycle are rendered once
+        """
+        self.model.append(data)
+        if not self._render_pending:
+            self._render_pending = True
+            self.after_idle(self.refresh)
+
+    def scroll_to(self, top: int):
+        self.top = top
+        self.refresh()
+
+    def _on_scroll(self, action, value, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(value) * len(self.model)))
+        elif action == "scroll":
+            step = self.height if unit == "pages" else 1
+            self.scroll_to(self.top + int(value) * step)
+
+    def _on_wheel(self, event):
+        self.scroll_to(self.top - 3 * (1 if event.delta > 0 else -1))
+
+    def sort(self, column: str):
+        previous = self.model.sort_key
+        ascending = not (previous and previous[0] == column and previous[1])
+        self.model.sort(column, ascending)
+        self.scroll_to(0)
+
+    def _fill_choices(self):
+        self.cmb_ticker["values"] = ["All"] + [
+            str(t) for t in self.model.values("Ticker")
+        ]
+        self.cmb_expiry["values"] = ["All"] + [
+            pd.Timestamp(e).strftime("%Y-%m-%d") for e in self.model.values("Maturity")
+        ]
+
+    def apply_filters(self):
+        ticker = self.cmb_ticker.get()
+        expiry = self.cmb_expiry.get()
+        try:
+            low = float(self.ent_low.get()) if self.ent_low.get() else None
+            high = float(self.ent_high.get()) if self.ent_high.get() else None
+        except ValueError:
+            messagebox.showerror("showerror", "Strike/Spot bounds should be numbers")
+            return
+        self.model.filter(
+            Ticker=ticker if ticker not in ("", "All") else None,
+            Maturity=pd.Timestamp(expiry) if expiry not in ("", "All") else None,
+            moneyness=(low, high) if low is not None or high is not None else None,
+        )
+        self.scroll_to(0)
+
+
 class Minor(ttk.Frame):
     """
     Minor frame Class - For a chosen Option
@@ -95,6 +233,13 @@ class Minor(ttk.Frame):
         self.btn_compute = ttk.Button(self, text="Compute")
         self.btn_compute.grid(row=9, column=0, columnspan=2, padx=7, pady=22)
 
+        # recompute while typing
+        self.var_live = tk.BooleanVar()
+        self.chk_live = ttk.Checkbutton(
+            self, text="Live", variable=self.var_live, onvalue=True, offvalue=False
+        )
+        self.chk_live.grid(row=9, column=2, padx=7, pady=22)
+
         self.label_result = ttk.Label(self, text="Result:")
         self.label_result.grid(row=10, column=0, columnspan=2)
 
@@ -137,17 +282,30 @@ class Minor(ttk.Frame):
     def error_msg(text: str):
         messagebox.showerror("showerror", str(text))
 
+    def inputs(self) -> list:
+        """
+        :return: the entries the option price depends on
+        """
+        return [
+            self.ent_type,
+            self.ent_strike,
+            self.ent_spot,
+            self.ent_maturity,
+            self.ent_vol,
+            self.ent_rf,
+            self.ent_div,
+        ]
+
     def update_status(self, status: str, value):
-        self.lbl_status = ttk.Label(
-            self, text=status, foreground=("red" if len(status) > 12 else "green")
-        )
-        self.lbl_val = ttk.Label(
-            self,
-            text=f"Intrinsic value: {value}",
-            foreground=("red" if len(status) > 12 else "green"),
-        )
-        self.lbl_status.grid(row=5, column=2, columnspan=2, pady=2)
-        self.lbl_val.grid(row=4, column=2, columnspan=2, pady=2)
+        # labels created on the first result, then only their text changes
+        if self.lbl_status is None:
+            self.lbl_status = ttk.Label(self)
+            self.lbl_val = ttk.Label(self)
+            self.lbl_status.grid(row=5, column=2, columnspan=2, pady=2)
+            self.lbl_val.grid(row=4, column=2, columnspan=2, pady=2)
+        color = "red" if len(status) > 12 else "green"
+        self.lbl_status.config(text=status, foreground=color)
+        self.lbl_val.config(text=f"Intrinsic value: {value}", foreground=color)
 
 
 class Major(ttk.Frame):
@@ -160,6 +318,9 @@ class Major(ttk.Frame):
         self.configure(relief="ridge")
         self.grid(row=0, column=1, sticky="nsew")
 
+        # portfolio table, opened by manage_pdtable
+        self.pt = None
+
         # Widgets
         self.lbl_title = ttk.Label(self, text="BSM model on random Portfolio")
         self.lbl_title.grid(row=0, column=1, padx=5, pady=25, columnspan=3)
@@ -170,7 +331,7 @@ class Major(ttk.Frame):
         self.var2 = tk.BooleanVar()
         self.chk_report = ttk.Checkbutton(
             self,
-            text="Export to Excel",
+            text="Export the portfolio",
             variable=self.var2,
             onvalue=True,
             offvalue=False,
@@ -179,67 +340,126 @@ class Major(ttk.Frame):
             row=6, column=1, columnspan=2, padx=7, pady=20, sticky="nsew"
         )
 
+        # every expiry and strike instead of one call and one put by ticker
+        self.var_full = tk.BooleanVar()
+        self.chk_full = ttk.Checkbutton(
+            self,
+            text="Full option chains",
+            variable=self.var_full,
+            onvalue=True,
+            offvalue=False,
+        )
+        self.chk_full.grid(row=6, column=3, padx=7, pady=20, sticky="nsew")
+
         self.btn_chart = ttk.Button(self, text="Generate Options' chart")
         self.btn_chart.grid(row=7, column=1, columnspan=2, padx=7, pady=20)
 
+        # progress of the background jobs
+        self.progress = ttk.Progressbar(self, mode="determinate", maximum=100)
+        self.progress.grid(row=8, column=1, columnspan=2, padx=7, sticky="ew")
+        self.lbl_progress = ttk.Label(self, text="")
+        self.lbl_progress.grid(row=9, column=1, columnspan=2)
+
+        self.btn_cancel = ttk.Button(self, text="Cancel", state="disabled")
+        self.btn_cancel.grid(row=10, column=1, columnspan=2, padx=7, pady=10)
+
     @staticmethod
     def info_msg(msg: str):
         messagebox.showinfo("Info", msg)
 
+    @staticmethod
+    def ask_export_path() -> str:
+        """
+        :return: file chosen by the user, empty if the dialog is closed
+        """
+        return filedialog.asksaveasfilename(
+            title="Export the portfolio",
+            initialfile="BSM_portfolio.xlsx",
+            defaultextension=".xlsx",
+            filetypes=[
+                ("Excel", "*.xlsx"),
+                ("Parquet", "*.parquet"),
+                ("Feather / Arrow IPC", "*.feather *.arrow"),
+                ("CSV", "*.csv"),
+            ],
+        )
+
+    def update_progress(self, value: float, text: str):
+        self.progress["value"] = value
+        self.lbl_progress.config(text=text)
+
+    def set_running(self, running: bool, cancellable: bool = True):
+        """
+        Lock the buttons while a background job runs, only Cancel stays available
+        when the job can be cancelled
+        """
+        self.btn_run.config(state="disabled" if running else "normal")
+        self.btn_chart.config(state="disabled" if running else "normal")
+        self.btn_cancel.config(
+            state="normal" if running and cancellable else "disabled"
+        )
+
     @staticmethod
     def option_chart(model):
         with PdfPages("Options_graph.pdf") as pdf:
             with plt.style.context("seaborn-v0_8-darkgrid"):
-                spot = np.arange(1, 150)
+                spot = np.linspace(1, 150, 1500)
+                strike = [63, 87, 124]
+
+                # whole greek mesh in one array operation (spot x strike)
+                greeks = model.grid(spot, strike, 5.0, 0.1)
+                call, put = greeks["CALL"], greeks["PUT"]
 
                 # Greek plot
 
                 fig, axes = plt.subplots(5, 1, figsize=(10, 25))
                 fig.suptitle("Greeks", ha="center", fontweight="bold", fontsize=15)
                 fig.tight_layout(pad=7.0)
-                strike = [63, 87, 124]
 
-                for s in strike:
-                    del_call = [
-                        model(float(s), float(x), 5.0, 0.1).delta("CALL") for x in spot
-                    ]
-                    del_put = [
-                        model(float(s), float(x), 5.0, 0.1).delta("PUT") for x in spot
-                    ]
+                for j, s in enumerate(strike):
+                    axes[0].plot(
+                        spot,
+                        call["delta"][:, j, 0, 0],
+                        linestyle="--",
+                        label=("Delta Call K=%s" % s),
+                    )
                     axes[0].plot(
-                        del_call, linestyle="--", label=("Delta Call K=%s" % s)
+                        spot, put["delta"][:, j, 0, 0], label=("Delta Put K=%s" % s)
                     )
-                    axes[0].plot(del_put, label=("Delta Put K=%s" % s))
 
                 axes[0].set_ylabel("Delta")
                 axes[0].legend()
 
-                for s in strike:
-                    gam = [model(float(s), float(x), 5.0, 0.1).gamma() for x in spot]
-                    axes[1].plot(gam, linestyle="--", label=("Options Gamma K=%s" % s))
+                for j, s in enumerate(strike):
+                    axes[1].plot(
+                        spot,
+                        call["gamma"][:, j, 0, 0],
+                        linestyle="--",
+                        label=("Options Gamma K=%s" % s),
+                    )
 
                 axes[1].set_ylabel("Gamma")
                 axes[1].legend()
 
-                for s in strike:
-                    veg = [model(float(s), float(x), 5.0, 0.1).vega() for x in spot]
-                    axes[2].plot(veg, label=("Options Vega K=%s" % s))
+                for j, s in enumerate(strike):
+                    axes[2].plot(
+                        spot, call["vega"][:, j, 0, 0], label=("Options Vega K=%s" % s)
+                    )
 
                 axes[2].set_ylabel("Vega")
                 axes[2].set_title("Volatility = 0.1 ")
                 axes[2].legend()
 
-                for s in strike:
-                    theta_call = [
-                        model(float(s), float(x), 5.0, 0.1).theta("CALL") for x in spot
-                    ]
-                    theta_put = [
-                        model(float(s), float(x), 5.0, 0.1).theta("PUT") for x in spot
-                    ]
+                for j, s in enumerate(strike):
+                    axes[3].plot(
+                        spot,
+                        call["theta"][:, j, 0, 0],
+                        linestyle="--",
+                        label=("Theta Call K=%s" % s),
+                    )
                     axes[3].plot(
-                        theta_call, linestyle="--", label=("Theta Call K=%s" % s)
+                        spot, put["theta"][:, j, 0, 0], label=("Theta Put K=%s" % s)
                     )
-                    axes[3].plot(theta_put, label=("Theta Put K=%s" % s))
 
                 axes[3].set_ylabel("Theta")
                 axes[3].set_title("Maturity = 5 years")
@@ -247,8 +467,7 @@ class Major(ttk.Frame):
 
                 # Option plot
 
-                call_val = [model(87.0, float(x), 1.0, 0.5).bsm("CALL") for x in spot]
-                put_val = [model(87.0, float(x), 1.0, 0.5).bsm("PUT") for x in spot]
+                prices = model.grid(spot, 87.0, 1.0, 0.5)
 
                 axes[4].set_title(
                     f"Change in option value with stock price"
@@ -257,17 +476,55 @@ class Major(ttk.Frame):
                 )
                 axes[4].set_xlabel("Stock Price")
                 axes[4].set_ylabel("Option price")
-                axes[4].plot(spot, call_val, color="green", label="Call")
-                axes[4].plot(spot, put_val, color="blue", label="Put")
+                axes[4].plot(
+                    spot,
+                    prices["CALL"]["price"][:, 0, 0, 0],
+                    color="green",
+                    label="Call",
+                )
+                axes[4].plot(
+                    spot, prices["PUT"]["price"][:, 0, 0, 0], color="blue", label="Put"
+                )
                 axes[4].legend()
 
             pdf.savefig()
             plt.close()
 
+            # Greek surfaces (spot x maturity)
+
+            with plt.style.context("seaborn-v0_8-darkgrid"):
+                maturity = np.linspace(0.05, 5, 100)
+                surface = model.grid(spot[::10], 87.0, maturity, 0.3)
+                x, y = np.meshgrid(maturity, spot[::10])
+
+                fig = plt.figure(figsize=(10, 20))
+                fig.suptitle(
+                    "Greek surfaces \n Strike: 87, sigma: 0.3, r: 5%, q: 4%",
+                    ha="center",
+                    fontweight="bold",
+                    fontsize=15,
+                )
+                for i, (greek, option_type) in enumerate(
+                    [("delta", "CALL"), ("gamma", "CALL"), ("theta", "PUT")], start=1
+                ):
+                    ax = fig.add_subplot(3, 1, i, projection="3d")
+                    ax.plot_surface(
+                        x,
+                        y,
+                        surface[option_type][greek][:, 0, :, 0],
+                        cmap="viridis",
+                    )
+                    ax.set_xlabel("Maturity")
+                    ax.set_ylabel("Stock Price")
+                    ax.set_zlabel(f"{greek.capitalize()} {option_type.capitalize()}")
+
+            pdf.savefig()
+            plt.close()
+
     def manage_pdtable(self, data: pd.DataFrame):
         """
-        Create a new window and display data in an Excel way , plot are feasible by using the plot button on the new
-        interface
+        Create a new window and display data in an Excel way, only the visible rows are
+        rendered so the window opens at once whatever the size of the book
 
         Parameters
         ----------
@@ -276,10 +533,17 @@ class Major(ttk.Frame):
         """
         window = Window(self)
 
-        frame = tk.Frame(master=window)
-        frame.pack(fill="both", expand=True)
+        pt = VirtualTable(window, TableModel(data))
+        pt.pack(fill="both", expand=True)
+        self.pt = pt
 
-        pt = Table(frame, showtoolbar=True, showstatusbar=True)
-        pt.show()
+    def append_pdtable(self, data: pd.DataFrame):
+        """
+        Append rows to the table opened by manage_pdtable (streamed results)
 
-        pt.model.df = data
+        Parameters
+        ----------
+        data : Dataframe with the same columns as the displayed one
+        -------
+        """
+        self.pt.append(data)